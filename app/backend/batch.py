@@ -0,0 +1,264 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import uuid
+import cv2
+from config import *
+from video_routes import processing_status, process_video_background
+from metrics import metrics_registry
+import logging
+
+logger = logging.getLogger(__name__)
+batch_router = APIRouter()
+
+class BatchRequest(BaseModel):
+    videos: List[str] = []
+    glob: Optional[str] = None
+    priority: int = 0
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
+def resolve_videos(videos=None, pattern=None):
+    """Normalizar una lista de nombres y/o un patrón glob a nombres de archivo .mp4"""
+    names = []
+    for name in videos or []:
+        name = name.strip()
+        if name:
+            names.append(name if name.endswith(".mp4") else f"{name}.mp4")
+    if pattern:
+        # Path.glob no admite patrones absolutos (NotImplementedError) ni vacíos (ValueError)
+        try:
+            names.extend(sorted(p.name for p in VIDEOS_ORIGINAL_DIR.glob(pattern)))
+        except (NotImplementedError, ValueError):
+            raise ValueError(f"Patrón glob inválido: {pattern}")
+    # Quitar duplicados conservando el orden
+    return list(dict.fromkeys(names))
+
+def count_frames(video_path):
+    cap = cv2.VideoCapture(str(video_path))
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+    return frames
+
+class Batch:
+    def __init__(self, videos, priority: int, max_concurrency: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.running = 0
+        self.deferred = []
+        self.videos = {
+            name: {"status": "queued", "cached": False, "frames": 0, "duration": None, "error": None}
+            for name in videos
+        }
+
+    def summary(self, include_videos: bool = True):
+        counts = {}
+        for video in self.videos.values():
+            counts[video["status"]] = counts.get(video["status"], 0) + 1
+
+        pending = counts.get("queued", 0) + counts.get("processing", 0)
+        if self.started_at is None:
+            status = "queued"
+        elif pending:
+            status = "running"
+        else:
+            status = "completed" if not counts.get("failed") and not counts.get("missing") else "completed_with_errors"
+
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0
+        # Los videos restaurados desde la caché no cuentan para el rendimiento de procesamiento
+        done = [v for v in self.videos.values() if v["status"] == "completed" and not v["cached"]]
+        cached = sum(1 for v in self.videos.values() if v["status"] == "completed" and v["cached"])
+        frames = sum(v["frames"] for v in done)
+
+        summary = {
+            "batch_id": self.id,
+            "status": status,
+            "priority": self.priority,
+            "max_concurrency": self.max_concurrency,
+            "total": len(self.videos),
+            "counts": counts,
+            "videos_processed": len(done),
+            "videos_cached": cached,
+            "frames_processed": frames,
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput": {
+                "videos_per_hour": round(len(done) * 3600 / elapsed, 2) if elapsed else 0,
+                "frames_per_second": round(frames / elapsed, 2) if elapsed else 0
+            }
+        }
+        if include_videos:
+            summary["videos"] = self.videos
+        return summary
+
+class BatchScheduler:
+    """Cola de prioridad global con un número fijo de workers para procesar lotes de videos"""
+    def __init__(self, concurrency: int = BATCH_CONCURRENCY):
+        self.concurrency = concurrency
+        self.batches = {}
+        self._queue = None
+        self._workers = []
+        self._counter = itertools.count()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def submit(self, videos, priority: int = 0, max_concurrency: int = None):
+        """Encolar un lote. Menor prioridad numérica se procesa antes"""
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency debe ser al menos 1")
+        self._ensure_workers()
+        batch = Batch(videos, priority, max_concurrency or self.concurrency)
+        self.batches[batch.id] = batch
+
+        for name in videos:
+            if not (VIDEOS_ORIGINAL_DIR / name).exists():
+                batch.videos[name]["status"] = "missing"
+                continue
+            metrics_registry.job_queued(name)
+            self._queue.put_nowait((priority, next(self._counter), batch.id, name))
+
+        if not any(v["status"] == "queued" for v in batch.videos.values()):
+            batch.started_at = batch.finished_at = time.time()
+        return batch
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._run(item)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, item):
+        _, _, batch_id, video_name = item
+        batch = self.batches[batch_id]
+
+        # Límite de concurrencia por lote: se aplaza hasta que termine otro video del lote
+        if batch.running >= batch.max_concurrency:
+            batch.deferred.append(item)
+            return
+
+        batch.running += 1
+        if batch.started_at is None:
+            batch.started_at = time.time()
+        video = batch.videos[video_name]
+        video["status"] = "processing"
+        start = time.time()
+
+        try:
+            if processing_status.is_running(video_name) or video_name in metrics_registry.active_jobs():
+                raise Exception("El video ya se está procesando")
+
+            video["frames"] = await asyncio.to_thread(count_frames, VIDEOS_ORIGINAL_DIR / video_name)
+            await process_video_background(video_name)
+            job = metrics_registry.get_job(video_name)
+            video["cached"] = job is not None and job.status == "cached"
+            video["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Batch {batch_id}: error procesando {video_name}: {str(e)}")
+            video["status"] = "failed"
+            video["error"] = str(e)
+        finally:
+            video["duration"] = round(time.time() - start, 2)
+            batch.running -= 1
+            if batch.deferred:
+                self._queue.put_nowait(batch.deferred.pop(0))
+            if not any(v["status"] in ("queued", "processing") for v in batch.videos.values()):
+                batch.finished_at = time.time()
+
+    async def wait(self, batch_id: str, interval: float = 1.0, on_progress=None):
+        """Esperar a que termine un lote, llamando on_progress(summary) periódicamente"""
+        batch = self.batches[batch_id]
+        while batch.finished_at is None:
+            if on_progress:
+                on_progress(batch.summary(include_videos=False))
+            await asyncio.sleep(interval)
+        return batch.summary()
+
+batch_scheduler = BatchScheduler()
+
+@batch_router.post("")
+async def create_batch(request: BatchRequest):
+    try:
+        videos = resolve_videos(request.videos, request.glob)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not videos:
+        raise HTTPException(status_code=400, detail="No se especificaron videos")
+
+    batch = batch_scheduler.submit(videos, request.priority, request.max_concurrency)
+    return batch.summary()
+
+@batch_router.get("")
+async def list_batches():
+    return {
+        "batches": [b.summary(include_videos=False) for b in batch_scheduler.batches.values()]
+    }
+
+@batch_router.get("/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = batch_scheduler.batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch no encontrado")
+    return batch.summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesar un lote de videos")
+    parser.add_argument("videos", nargs="*", help="Nombres de video (con o sin .mp4)")
+    parser.add_argument("--glob", help="Patrón glob dentro de videos_original, p.ej. 'VIRAT_S_0002*.mp4'")
+    parser.add_argument("--list", dest="list_file", help="Archivo con un nombre de video por línea")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--priority", type=int, default=0)
+    parser.add_argument("--output", help="Guardar el resumen final como JSON")
+    args = parser.parse_args()
+
+    from database import init_database
+    init_database()
+
+    videos = list(args.videos)
+    if args.list_file:
+        with open(args.list_file) as f:
+            videos.extend(line.strip() for line in f if line.strip())
+    if args.concurrency < 1:
+        parser.error("--concurrency debe ser al menos 1")
+    try:
+        videos = resolve_videos(videos, args.glob)
+    except ValueError as e:
+        parser.error(str(e))
+    if not videos:
+        parser.error("No se especificaron videos")
+
+    async def run():
+        scheduler = BatchScheduler(args.concurrency)
+        batch = scheduler.submit(videos, args.priority)
+
+        def on_progress(summary):
+            print(
+                f"[{summary['status']}] {summary['counts']} "
+                f"{summary['throughput']['videos_per_hour']} videos/h "
+                f"{summary['throughput']['frames_per_second']} fps"
+            )
+
+        return await scheduler.wait(batch.id, interval=5.0, on_progress=on_progress)
+
+    summary = asyncio.run(run())
+    print(json.dumps({k: v for k, v in summary.items() if k != "videos"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
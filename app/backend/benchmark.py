@@ -0,0 +1,309 @@
+"""
+Benchmark del pipeline de procesamiento y de la API.
+
+Mide frames/segundo, tiempo de CPU y pico de memoria (RSS) de cada etapa
+ejecutándola en un proceso nuevo, y la latencia de los endpoints bajo carga
+concurrente. Usa el clip VIRAT incluido y videos/metadata sintéticos de
+longitud configurable. Los resultados se guardan como JSON para comparar
+ejecuciones.
+
+    python benchmark.py --frames 300 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import cv2
+from config import *
+
+BUNDLED_VIDEO = "VIRAT_S_010005_04_000299_000323.mp4"
+STAGES = ("metadata", "render", "heatmap", "fused", "search")
+LABELS = ("person", "car", "bicycle", "truck", "backpack")
+
+def make_synthetic_video(path, frames: int, width: int, height: int, fps: float, num_objects: int):
+    """Video con fondo estático con ruido y rectángulos que se desplazan"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 80, (height, width, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    starts = rng.integers(0, [width // 2, height // 2], (num_objects, 2))
+    speeds = rng.integers(1, 6, (num_objects, 2))
+
+    for i in range(frames):
+        frame = background.copy()
+        for (x, y), (dx, dy) in zip(starts, speeds):
+            x1 = int((x + dx * i) % (width - 80))
+            y1 = int((y + dy * i) % (height - 160))
+            cv2.rectangle(frame, (x1, y1), (x1 + 60, y1 + 150), (200, 180, 160), -1)
+        writer.write(frame)
+    writer.release()
+
+def make_synthetic_metadata(frames: int, width: int, height: int, num_objects: int):
+    """Metadata con num_objects detecciones por frame en el formato de generate_metadata"""
+    rng = np.random.default_rng(1)
+    metadata = []
+    for i in range(frames):
+        objects = []
+        for _ in range(num_objects):
+            x1 = int(rng.integers(0, width - 100))
+            y1 = int(rng.integers(0, height - 200))
+            objects.append({
+                "label": LABELS[int(rng.integers(0, len(LABELS)))],
+                "confidence": float(rng.uniform(0.3, 1.0)),
+                "coordinates": [[x1, y1, x1 + int(rng.integers(20, 100)), y1 + int(rng.integers(40, 200))]]
+            })
+        metadata.append({"frame": i, "objects": objects})
+    return metadata
+
+def _redirect_outputs(module, workdir):
+    """Apuntar los directorios del módulo al directorio de trabajo del benchmark"""
+    module.VIDEOS_ORIGINAL_DIR = workdir
+    module.METADATA_DIR = workdir
+    module.OUTPUT_VIDEOS_DIR = workdir
+    if hasattr(module, "insert_or_update_video_data"):
+        module.insert_or_update_video_data = lambda *args, **kwargs: True
+
+def _run_stage(stage: str, video_name: str, workdir: str):
+    """Ejecutar una etapa en el proceso actual y medir tiempo, CPU y memoria"""
+    import storage
+    workdir = Path(workdir)
+    _redirect_outputs(storage, workdir)
+    video_path = workdir / video_name
+    metadata = storage.load_metadata(storage.metadata_path(video_name))
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    if stage == "metadata":
+        from video_routes import generate_metadata
+        generate_metadata(str(video_path), str(storage.metadata_path("bench_metadata.mp4")))
+    elif stage == "render":
+        from video_routes import process_video_with_metadata
+        process_video_with_metadata(video_path, workdir / f"processed_{video_name}", metadata)
+    elif stage == "heatmap":
+        import heatmap
+        _redirect_outputs(heatmap, workdir)
+        heatmap.generate_heatmap_background(video_name)
+    elif stage == "fused":
+        from pipeline import run_fused_pipeline
+        run_fused_pipeline(
+            video_path,
+            output_path=workdir / f"fused_{video_name}",
+            heatmap_path=workdir / f"fused_{video_name.replace('.mp4', '.png')}",
+            metadata=metadata
+        )
+    elif stage == "search":
+        import metadata_routes
+        _redirect_outputs(metadata_routes, workdir)
+        metadata_routes.search_object(metadata[0]["objects"][0]["label"] if metadata else "person")
+    else:
+        raise ValueError(f"Etapa desconocida: {stage}")
+
+    return {
+        "wall_seconds": time.perf_counter() - wall_start,
+        "cpu_seconds": time.process_time() - cpu_start,
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def bench_stage(stage: str, video_name: str, workdir: Path, frames: int):
+    """Ejecutar la etapa en un proceso nuevo para que el pico de RSS sea solo el suyo"""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        try:
+            result = pool.submit(_run_stage, stage, video_name, str(workdir)).result()
+        except Exception as e:
+            return {"error": str(e)}
+
+    if stage != "search":
+        result["frames"] = frames
+        result["frames_per_second"] = frames / result["wall_seconds"] if result["wall_seconds"] else 0
+    return result
+
+def bench_scaling(video_name: str, workdir: Path, frames: int, max_workers: int):
+    """
+    Speedup de la detección repartida con 1..max_workers procesos. Sin mínimo
+    de frames por shard para que cada ejecución use de verdad los procesos
+    pedidos; "shards" registra los que se usaron (puede haber menos si dos
+    cortes caen en el mismo keyframe).
+    """
+    from sharding import generate_metadata_sharded
+    from metrics import JobMetrics
+
+    counts = sorted({1, max_workers} | {2 ** i for i in range(1, max_workers.bit_length()) if 2 ** i < max_workers})
+    results = []
+    for workers in counts:
+        job = JobMetrics()
+        start = time.perf_counter()
+        try:
+            generate_metadata_sharded(
+                str(workdir / video_name), str(workdir / f"sharded_{workers}.json"), workers=workers,
+                metrics=job, min_frames=1
+            )
+        except Exception as e:
+            results.append({"workers": workers, "error": str(e)})
+            continue
+        elapsed = time.perf_counter() - start
+        results.append({
+            "workers": workers,
+            "shards": job.shards,
+            "wall_seconds": elapsed,
+            "frames_per_second": frames / elapsed if elapsed else 0
+        })
+
+    baseline = next((r["wall_seconds"] for r in results if r.get("shards") == 1), None)
+    for result in results:
+        if baseline and "wall_seconds" in result:
+            result["speedup"] = baseline / result["wall_seconds"]
+    return {"video": video_name, "frames": frames, "runs": results}
+
+def _percentiles(latencies):
+    latencies = sorted(latencies)
+    def pct(p):
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+    return {
+        "requests": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": latencies[-1] * 1000
+    }
+
+async def bench_api(base_url: str, paths, requests: int, concurrency: int):
+    """Latencia de cada endpoint con `concurrency` peticiones simultáneas"""
+    import httpx
+
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        import main
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+
+    results = {}
+    async with client:
+        for path in paths:
+            latencies = []
+            errors = 0
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(path)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code >= 500:
+                        errors += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(requests)))
+            elapsed = time.perf_counter() - start
+
+            results[path] = _percentiles(latencies)
+            results[path]["errors"] = errors
+            results[path]["requests_per_second"] = requests / elapsed
+    return results
+
+def prepare_inputs(args, workdir: Path):
+    """Copiar el clip incluido y generar las entradas sintéticas en workdir"""
+    import storage
+    inputs = {}
+
+    bundled = VIDEOS_ORIGINAL_DIR / BUNDLED_VIDEO
+    bundled_metadata = storage.metadata_path(BUNDLED_VIDEO)
+    if not args.skip_bundled and bundled.exists() and bundled_metadata.exists():
+        shutil.copy(bundled, workdir / BUNDLED_VIDEO)
+        shutil.copy(bundled_metadata, workdir / bundled_metadata.name)
+        cap = cv2.VideoCapture(str(bundled))
+        inputs[BUNDLED_VIDEO] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+    for frames in args.frames:
+        name = f"synthetic_{frames}f_{args.width}x{args.height}.mp4"
+        make_synthetic_video(workdir / name, frames, args.width, args.height, args.fps, args.objects)
+        metadata = make_synthetic_metadata(frames, args.width, args.height, args.objects)
+        storage.save_metadata(workdir / storage.metadata_path(name).name, metadata)
+        inputs[name] = frames
+
+    return inputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline y de la API")
+    parser.add_argument("--frames", type=int, nargs="+", default=[300], help="Longitudes de los videos sintéticos")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--objects", type=int, default=5, help="Objetos por frame en los datos sintéticos")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Etapas separadas por comas ({','.join(STAGES)})")
+    parser.add_argument("--skip-bundled", action="store_true", help="No usar el clip VIRAT incluido")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--scaling", type=int, metavar="N", help="Medir la detección repartida con 1..N workers")
+    parser.add_argument("--url", help="URL de un servidor en ejecución (por defecto la app en proceso)")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    stages = [s for s in args.stages.split(",") if s]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {
+            "python": sys.version.split()[0],
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "opencv": cv2.__version__
+        },
+        "config": vars(args),
+        "stages": {},
+        "scaling": None,
+        "api": {}
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        workdir = Path(tmp)
+        inputs = prepare_inputs(args, workdir)
+
+        for video_name, frames in inputs.items():
+            report["stages"][video_name] = {}
+            for stage in stages:
+                print(f"{video_name}: {stage}...", flush=True)
+                result = bench_stage(stage, video_name, workdir, frames)
+                report["stages"][video_name][stage] = result
+                print(f"  {json.dumps(result)}", flush=True)
+
+        if args.scaling and inputs:
+            video_name, frames = next(iter(inputs.items()))
+            print(f"{video_name}: scaling 1..{args.scaling} workers...", flush=True)
+            report["scaling"] = bench_scaling(video_name, workdir, frames, args.scaling)
+            for run in report["scaling"]["runs"]:
+                print(f"  {json.dumps(run)}", flush=True)
+
+    if not args.skip_api:
+        paths = [
+            "/videos/available-videos",
+            f"/videos/status/{BUNDLED_VIDEO}",
+            f"/metadata/{BUNDLED_VIDEO}",
+            f"/metadata/objects/{BUNDLED_VIDEO}",
+            "/metadata/search/person",
+        ]
+        print("API...", flush=True)
+        report["api"] = asyncio.run(bench_api(args.url, paths, args.requests, args.concurrency))
+        for path, result in report["api"].items():
+            print(f"  {path}: p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms {result['requests_per_second']:.1f} req/s")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
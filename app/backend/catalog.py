@@ -0,0 +1,98 @@
+import os
+import hashlib
+from config import *
+import storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+VIDEO_STATES = ("processed", "partial", "pending", "processing")
+
+def _mtime(path: Path):
+    try:
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+def _non_empty_files(directory: Path):
+    """Nombres de archivos no vacíos de un directorio, con un solo listado"""
+    names = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_size > 0:
+                names.add(entry.name)
+    return names
+
+class VideoCatalog:
+    """
+    Catálogo en memoria de los videos disponibles y su estado de procesamiento.
+    Se recarga solo cuando cambia la fecha de modificación del archivo de lista
+    o de alguno de los directorios de videos, metadata o salidas.
+    """
+    def __init__(self):
+        self._signature = None
+        self.videos = []
+        self.states = {}
+
+    def _current_signature(self):
+        return (
+            _mtime(LIST_FILE),
+            _mtime(VIDEOS_ORIGINAL_DIR),
+            _mtime(METADATA_DIR),
+            _mtime(OUTPUT_VIDEOS_DIR),
+        )
+
+    def refresh(self):
+        signature = self._current_signature()
+        if signature == self._signature:
+            return False
+
+        videos = []
+        if LIST_FILE.exists():
+            originals = set(os.listdir(VIDEOS_ORIGINAL_DIR))
+            with open(LIST_FILE, "r") as file:
+                videos = [
+                    line.strip() + ".mp4"
+                    for line in file
+                    if line.strip() and f"{line.strip()}.mp4" in originals
+                ]
+
+        metadata_files = _non_empty_files(METADATA_DIR)
+        output_files = _non_empty_files(OUTPUT_VIDEOS_DIR)
+
+        states = {}
+        for video_name in videos:
+            ready = [
+                any(path.name in metadata_files for path in storage.metadata_candidates(video_name)),
+                f"processed_{video_name}" in output_files,
+                f"heatmap_{video_name.replace('.mp4', '.png')}" in output_files,
+            ]
+            states[video_name] = "processed" if all(ready) else "partial" if any(ready) else "pending"
+
+        self.videos = videos
+        self.states = states
+        self._signature = signature
+        logger.debug(f"Catálogo recargado: {len(videos)} videos")
+        return True
+
+    def query(self, processing=(), state: str = None, offset: int = 0, limit: int = None):
+        """
+        Retornar (página de videos, estados de la página, total filtrado, etag).
+        processing son los videos que se están procesando en este momento.
+        """
+        self.refresh()
+
+        processing = set(processing)
+        states = {
+            name: "processing" if name in processing else self.states[name]
+            for name in self.videos
+        }
+        videos = [name for name in self.videos if state is None or states[name] == state]
+        page = videos[offset:offset + limit if limit is not None else None]
+
+        etag_source = repr((self._signature, sorted(processing), state, offset, limit))
+        etag = '"' + hashlib.sha1(etag_source.encode()).hexdigest() + '"'
+        return page, {name: states[name] for name in page}, len(videos), etag
+
+video_catalog = VideoCatalog()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 #obtener la ruta base del proyecto
@@ -8,6 +9,10 @@ VIDEOS_ORIGINAL_DIR = BASE_DIR / "videos_original"
 OUTPUT_VIDEOS_DIR = BASE_DIR / "output_videos"
 METADATA_DIR = BASE_DIR / "metadata"
 MODELS_DIR = BASE_DIR / "models"
+CACHE_DIR = BASE_DIR / "cache"
+SUMMARIES_DIR = BASE_DIR / "summaries"
+PROFILES_DIR = BASE_DIR / "profiles"
+ROI_DIR = BASE_DIR / "roi_masks"
 
 #ruta del archivo list_release2.0.txt
 LIST_FILE = BASE_DIR / "list_release2.0.txt"
@@ -17,6 +22,10 @@ VIDEOS_ORIGINAL_DIR.mkdir(exist_ok=True)
 OUTPUT_VIDEOS_DIR.mkdir(exist_ok=True)
 METADATA_DIR.mkdir(exist_ok=True)
 MODELS_DIR.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(exist_ok=True)
+SUMMARIES_DIR.mkdir(exist_ok=True)
+PROFILES_DIR.mkdir(exist_ok=True)
+ROI_DIR.mkdir(exist_ok=True)
 
 #configuración de la API
 API_HOST = "127.0.0.1"
@@ -26,4 +35,61 @@ API_PORT = 8000
 DATABASE_PATH = BASE_DIR / "metadata.db"
 
 # Configuración del modelo YOLO
-MODEL_PATH = MODELS_DIR / "yolov8n.pt"
\ No newline at end of file
+MODEL_PATH = MODELS_DIR / "yolov8n.pt"
+
+# Backend del detector: "ultralytics" (PyTorch) u "onnx" (ONNX Runtime, exportado desde MODEL_PATH)
+DETECTOR_BACKEND = "ultralytics"
+# Tamaño de entrada de la red e hilos de inferencia (0 = automático)
+INFERENCE_IMGSZ = 640
+INFERENCE_THREADS = 0
+# Cuantizar el modelo ONNX a int8
+ONNX_QUANTIZE = False
+
+# Umbral de confianza mínimo para guardar una detección
+CONFIDENCE_THRESHOLD = 0.3
+
+# Generar metadata, video anotado y heatmap en una sola decodificación del video
+FUSED_PIPELINE = True
+
+# Número de videos procesados en paralelo por el planificador de lotes
+BATCH_CONCURRENCY = 2
+
+# Duración en segundos de cada intervalo de ocupación en los resúmenes de objetos
+SUMMARY_BUCKET_SECONDS = 1
+
+# Perfilar con cProfile todos los trabajos (también se puede pedir por trabajo con ?profile=true)
+PROFILE_ALL_JOBS = False
+
+# Detección repartida en varios procesos para un mismo video
+SHARDED_DETECTION = False
+SHARD_WORKERS = os.cpu_count() or 1
+SHARD_MIN_FRAMES = 120
+
+# Inferencia solo en las regiones activas de cada cámara fija.
+# La máscara se lee de roi_masks/<cámara>.png (blanco = activo) o se aprende de la
+# metadata existente y se guarda en roi_masks/<cámara>_learned.png (borrarla para reaprender)
+ROI_ENABLED = False
+ROI_MARGIN = 32
+ROI_MIN_DETECTIONS = 200
+# Fracción del máximo de detecciones por píxel a partir de la cual un píxel de la máscara aprendida es activo
+ROI_DENSITY_THRESHOLD = 0.05
+# Si las regiones cubren más de esta fracción del frame se usa el frame completo
+ROI_MAX_COVERAGE = 0.8
+# Cada cuántos frames se analiza el frame completo (0 = nunca)
+ROI_FULL_FRAME_INTERVAL = 30
+
+# Configuración de la caché de resultados (metadata, video procesado y heatmap)
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+# Compresión de la metadata en disco: "zstd" (gzip si zstandard no está instalado), "gzip" o "none".
+# Se aplica a la metadata nueva; la existente se recomprime con `python storage.py migrate`
+METADATA_COMPRESSION = "zstd"
+METADATA_COMPRESSION_LEVEL = 9
+
+# Videos procesados y heatmaps se pueden regenerar: al superar el tamaño total o la
+# antigüedad sin acceso se borran los menos usados y se regeneran al volver a pedirlos (0 = sin límite)
+OUTPUTS_MAX_BYTES = 20 * 1024 ** 3
+OUTPUTS_MAX_AGE_DAYS = 30
+
+# Caché en memoria de las respuestas de GET /metadata/{video} ya serializadas y comprimidas
+METADATA_RESPONSE_CACHE_BYTES = 256 * 1024 ** 2
\ No newline at end of file
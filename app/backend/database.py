@@ -13,6 +13,7 @@ def init_database():
     else:
         # Verificar y actualizar registros existentes
         sync_database_with_files()
+        drop_metadata_copies()
 
 def sync_database_with_files():
     """Sincronizar la base de datos con los archivos existentes"""
@@ -24,29 +25,34 @@ def sync_database_with_files():
         video_name = video_file.name
         processed_path = OUTPUT_VIDEOS_DIR / f"processed_{video_name}"
         heatmap_path = OUTPUT_VIDEOS_DIR / f"heatmap_{video_name.replace('.mp4', '.png')}"
-        metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
         
         if processed_path.exists() or heatmap_path.exists():
             # Construir rutas relativas
             processed_rel_path = f"/output_videos/processed_{video_name}" if processed_path.exists() else ""
             heatmap_rel_path = f"/output_videos/heatmap_{video_name.replace('.mp4', '.png')}" if heatmap_path.exists() else ""
             
-            # Leer metadata si existe
-            metadata_json = ""
-            if metadata_path.exists():
-                with open(metadata_path, 'r') as f:
-                    metadata_json = f.read()
-            
             # Actualizar o insertar en la base de datos
             insert_or_update_video_data(
                 video_name,
-                metadata=metadata_json,
                 processed_video_path=processed_rel_path,
                 heatmap_path=heatmap_rel_path
             )
     
     conn.close()
 
+def drop_metadata_copies():
+    """
+    Vaciar la copia de la metadata que se guardaba en la columna metadata.
+    La metadata vive solo en METADATA_DIR; la columna se conserva por compatibilidad.
+    """
+    conn = sqlite3.connect(str(DATABASE_PATH))
+    cursor = conn.execute("UPDATE metadata SET metadata = '' WHERE metadata != ''")
+    conn.commit()
+    if cursor.rowcount > 0:
+        conn.execute("VACUUM")
+        logger.info(f"Eliminadas {cursor.rowcount} copias de metadata de la base de datos")
+    conn.close()
+
 def create_database():
     """Crear base de datos SQLite para metadata y archivos procesados"""
     conn = sqlite3.connect(str(DATABASE_PATH))
@@ -67,7 +73,7 @@ def create_database():
     conn.commit()
     conn.close()
 
-def insert_or_update_video_data(video_name, metadata=None, processed_video_path=None, heatmap_path=None):
+def insert_or_update_video_data(video_name, processed_video_path=None, heatmap_path=None):
     max_retries = 3
     retry_count = 0
     
@@ -83,10 +89,6 @@ def insert_or_update_video_data(video_name, metadata=None, processed_video_path=
                 update_fields = []
                 update_values = []
                 
-                if metadata is not None:
-                    update_fields.append("metadata = ?")
-                    update_values.append(metadata)
-                
                 if processed_video_path is not None:
                     update_fields.append("processed_video_path = ?")
                     update_values.append(processed_video_path)
@@ -105,8 +107,8 @@ def insert_or_update_video_data(video_name, metadata=None, processed_video_path=
             else:
                 cursor.execute("""
                     INSERT INTO metadata (video_name, metadata, processed_video_path, heatmap_path)
-                    VALUES (?, ?, ?, ?)
-                """, (video_name, metadata or "", processed_video_path or "", heatmap_path or ""))
+                    VALUES (?, '', ?, ?)
+                """, (video_name, processed_video_path or "", heatmap_path or ""))
             
             conn.commit()
             conn.close()
@@ -125,7 +127,7 @@ def get_video_data(video_name):
     cursor = conn.cursor()
     
     cursor.execute("""
-        SELECT video_name, metadata, processed_video_path, heatmap_path, created_at
+        SELECT video_name, processed_video_path, heatmap_path, created_at
         FROM metadata 
         WHERE video_name = ?
     """, (video_name,))
@@ -136,10 +138,9 @@ def get_video_data(video_name):
     if result:
         return {
             "video_name": result[0],
-            "metadata": result[1],
-            "processed_video_path": result[2],
-            "heatmap_path": result[3],
-            "created_at": result[4]
+            "processed_video_path": result[1],
+            "heatmap_path": result[2],
+            "created_at": result[3]
         }
     return None
 
@@ -0,0 +1,249 @@
+import abc
+import argparse
+import ast
+import json
+import cv2
+import numpy as np
+from config import *
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mismos valores por defecto que el NMS de ultralytics
+NMS_CONFIDENCE = 0.25
+NMS_IOU = 0.7
+MAX_DETECTIONS = 300
+
+class Detector(abc.ABC):
+    """Interfaz común de los backends de detección"""
+    names = {}
+
+    @abc.abstractmethod
+    def detect(self, frame, imgsz: int = None):
+        """
+        Retornar las detecciones de un frame BGR con confianza > CONFIDENCE_THRESHOLD.
+        imgsz permite usar un tamaño de entrada distinto de INFERENCE_IMGSZ.
+        """
+
+class UltralyticsDetector(Detector):
+    """YOLO de ultralytics sobre PyTorch"""
+    def __init__(self, threads: int = None):
+        from ultralytics import YOLO
+        threads = threads or INFERENCE_THREADS
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(str(MODEL_PATH))
+        self.names = self.model.names
+
+    def detect(self, frame, imgsz: int = None):
+        results = self.model(frame, imgsz=imgsz or INFERENCE_IMGSZ)
+        detections = []
+
+        for r in results[0]:
+            for box, cls, conf in zip(r.boxes.xyxy, r.boxes.cls, r.boxes.conf):
+                if conf > CONFIDENCE_THRESHOLD:
+                    coords = box.cpu().numpy()
+                    detections.append({
+                        "label": self.names[int(cls)],
+                        "confidence": float(conf),
+                        "coordinates": [[int(c) for c in coords]]
+                    })
+
+        return detections
+
+def letterbox(frame, size: int, stride: int = 32):
+    """
+    Redimensionar manteniendo proporción y rellenar hasta el múltiplo de stride
+    más cercano, igual que LetterBox(auto=True) de ultralytics para modelos .pt
+    """
+    height, width = frame.shape[:2]
+    gain = min(size / height, size / width)
+    new_w, new_h = int(round(width * gain)), int(round(height * gain))
+    pad_x, pad_y = ((size - new_w) % stride) / 2, ((size - new_h) % stride) / 2
+
+    if (new_w, new_h) != (width, height):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return frame, gain, (left, top)
+
+def onnx_model_path(quantize: bool = ONNX_QUANTIZE):
+    if quantize:
+        return MODELS_DIR / f"{MODEL_PATH.stem}_{INFERENCE_IMGSZ}_int8.onnx"
+    return MODELS_DIR / f"{MODEL_PATH.stem}_{INFERENCE_IMGSZ}.onnx"
+
+def export_onnx(quantize: bool = ONNX_QUANTIZE):
+    """Exportar los pesos de MODEL_PATH a ONNX (y opcionalmente cuantizar a int8)"""
+    from ultralytics import YOLO
+
+    fp32_path = onnx_model_path(quantize=False)
+    if not fp32_path.exists():
+        # Ejes dinámicos para aceptar la entrada rectangular de letterbox()
+        exported = YOLO(str(MODEL_PATH)).export(format="onnx", imgsz=INFERENCE_IMGSZ, dynamic=True)
+        Path(exported).replace(fp32_path)
+        logger.info(f"Modelo exportado a {fp32_path}")
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = onnx_model_path(quantize=True)
+    if not int8_path.exists():
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QUInt8)
+        logger.info(f"Modelo cuantizado a {int8_path}")
+    return int8_path
+
+def nms(xyxy, confidences, class_ids, iou: float = NMS_IOU):
+    """NMS por clase: se desplazan las cajas de cada clase para que no se solapen entre clases"""
+    shifted = xyxy + class_ids[:, None] * 7680.0
+    indices = cv2.dnn.NMSBoxes(
+        [[float(b[0]), float(b[1]), float(b[2] - b[0]), float(b[3] - b[1])] for b in shifted],
+        [float(c) for c in confidences], 0.0, iou
+    )
+    # NMSBoxes devuelve los índices ordenados por confianza descendente
+    return np.array(indices, dtype=int).reshape(-1)[:MAX_DETECTIONS]
+
+class OnnxDetector(Detector):
+    """YOLOv8 exportado a ONNX ejecutado con ONNX Runtime en CPU"""
+    def __init__(self, threads: int = None):
+        import onnxruntime as ort
+
+        path = onnx_model_path()
+        if not path.exists():
+            path = export_onnx()
+
+        options = ort.SessionOptions()
+        threads = threads or INFERENCE_THREADS
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        # ultralytics guarda los nombres de clase en los metadatos del modelo exportado
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+
+    def detect(self, frame, imgsz: int = None):
+        height, width = frame.shape[:2]
+        image, gain, (pad_x, pad_y) = letterbox(frame, imgsz or INFERENCE_IMGSZ)
+        blob = cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True)
+
+        # Salida (1, 4 + clases, N): cx, cy, w, h y una puntuación por clase
+        output = self.session.run(None, {self.input_name: blob})[0][0].T
+        scores = output[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+
+        keep = confidences > NMS_CONFIDENCE
+        boxes, class_ids, confidences = output[keep, :4], class_ids[keep], confidences[keep]
+        if not len(boxes):
+            return []
+
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+        xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+        xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+        xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+        indices = nms(xyxy, confidences, class_ids)
+
+        # Volver a coordenadas del frame original
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / gain).clip(0, width)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / gain).clip(0, height)
+
+        detections = []
+        for i in sorted(indices, key=lambda i: -confidences[i]):
+            if confidences[i] > CONFIDENCE_THRESHOLD:
+                detections.append({
+                    "label": self.names.get(int(class_ids[i]), str(int(class_ids[i]))),
+                    "confidence": float(confidences[i]),
+                    "coordinates": [[int(c) for c in xyxy[i]]]
+                })
+        return detections
+
+DETECTOR_BACKENDS = {
+    "ultralytics": UltralyticsDetector,
+    "onnx": OnnxDetector,
+}
+
+def load_detector(threads: int = None, backend: str = None):
+    backend = backend or DETECTOR_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Backend de detección desconocido: {backend}")
+    return DETECTOR_BACKENDS[backend](threads)
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+def compare_backends(video_path, frames: int = 100, reference: str = "ultralytics", candidate: str = "onnx",
+                     iou_threshold: float = 0.5):
+    """
+    Comparar dos backends sobre los primeros frames de un video. Una detección
+    coincide si hay otra con la misma etiqueta e IoU >= iou_threshold.
+    """
+    ref_detector = load_detector(backend=reference)
+    cand_detector = load_detector(backend=candidate)
+    cap = cv2.VideoCapture(str(video_path))
+
+    matched = ref_total = cand_total = 0
+    confidence_diffs = []
+    for _ in range(frames):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        ref = ref_detector.detect(frame)
+        cand = cand_detector.detect(frame)
+        ref_total += len(ref)
+        cand_total += len(cand)
+
+        unused = list(cand)
+        for r in ref:
+            best = max(
+                (c for c in unused if c["label"] == r["label"]),
+                key=lambda c: _iou(r["coordinates"][0], c["coordinates"][0]),
+                default=None
+            )
+            if best and _iou(r["coordinates"][0], best["coordinates"][0]) >= iou_threshold:
+                matched += 1
+                confidence_diffs.append(abs(r["confidence"] - best["confidence"]))
+                unused.remove(best)
+    cap.release()
+
+    return {
+        "reference": reference,
+        "candidate": candidate,
+        "reference_detections": ref_total,
+        "candidate_detections": cand_total,
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "mean_confidence_diff": float(np.mean(confidence_diffs)) if confidence_diffs else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar y comparar backends de detección")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exportar MODEL_PATH a ONNX")
+    export_parser.add_argument("--int8", action="store_true", help="Cuantizar a int8")
+
+    compare_parser = subparsers.add_parser("compare", help="Comparar las detecciones de dos backends")
+    compare_parser.add_argument("video")
+    compare_parser.add_argument("--frames", type=int, default=100)
+    compare_parser.add_argument("--reference", default="ultralytics")
+    compare_parser.add_argument("--candidate", default="onnx")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(export_onnx(quantize=args.int8))
+    else:
+        print(json.dumps(compare_backends(args.video, args.frames, args.reference, args.candidate), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import HTTPException
 from starlette.types import Scope, Receive, Send
-from video_routes import video_router
+from video_routes import video_router, regenerate_outputs
 from metadata_routes import metadata_router
 from heatmap import heatmap_router
+from batch import batch_router
+from storage import storage_router, init_storage, output_video_name, mark_accessed
 from database import init_database
+from metrics import metrics_registry
 from config import *
 import os
 import logging
@@ -20,6 +23,7 @@ app = FastAPI(title="Sistema de Detección de Videos")
 
 # Inicializar la base de datos al inicio
 init_database()
+init_storage()
 
 class VideoStaticFiles(StaticFiles):
     async def __call__(self, scope: Scope, receive: Send, send: Send):
@@ -40,9 +44,33 @@ class VideoStaticFiles(StaticFiles):
         
         await super().__call__(scope, receive, send)
 
+class OutputStaticFiles(VideoStaticFiles):
+    """
+    Salidas procesadas: registra los accesos y regenera las borradas por los
+    límites de almacenamiento. Las de videos sin metadata dan 404.
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            file_name = Path(scope["path"]).name
+            video_name = output_video_name(file_name)
+            output_path = OUTPUT_VIDEOS_DIR / file_name
+            if video_name is not None and output_path.exists():
+                mark_accessed(output_path)
+            elif video_name is not None and (VIDEOS_ORIGINAL_DIR / video_name).exists():
+                if await regenerate_outputs(video_name) is False:
+                    response = JSONResponse(
+                        status_code=503,
+                        content={"status": "processing", "detail": "El archivo se está regenerando"},
+                        headers={"Retry-After": "10"}
+                    )
+                    await response(scope, receive, send)
+                    return
+
+        await super().__call__(scope, receive, send)
+
 # Actualizar el montaje de los directorios estáticos
 app.mount("/videos_original", VideoStaticFiles(directory=str(VIDEOS_ORIGINAL_DIR)), name="videos_original")
-app.mount("/output_videos", VideoStaticFiles(directory=str(OUTPUT_VIDEOS_DIR)), name="output_videos")
+app.mount("/output_videos", OutputStaticFiles(directory=str(OUTPUT_VIDEOS_DIR)), name="output_videos")
 
 # Montar los archivos estáticos del frontend correctamente
 frontend_dir = BASE_DIR.parent / "frontend"
@@ -61,12 +89,18 @@ app.add_middleware(
 app.include_router(video_router, prefix="/videos", tags=["Videos"])
 app.include_router(metadata_router, prefix="/metadata", tags=["Metadata"])
 app.include_router(heatmap_router, prefix="/heatmap", tags=["Heatmap"])
+app.include_router(batch_router, prefix="/batch", tags=["Batch"])
+app.include_router(storage_router, prefix="/storage", tags=["Storage"])
 
 # Servir archivos estáticos individuales
 @app.get("/")
 async def read_root():
     return FileResponse(str(frontend_dir / "index.html"))
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/favicon.ico")
 async def get_favicon():
     favicon_path = frontend_dir / "favicon.ico"
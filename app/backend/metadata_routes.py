@@ -1,15 +1,23 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-import os
-import json
-from config import *
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, Response
+from summaries import load_summary, label_occurrences
+from response_cache import metadata_responses, negotiate_encoding
+import storage
 
 metadata_router = APIRouter()
 
+# Máximo de apariciones por página en GET /metadata/objects/{video}/{objeto}
+OCCURRENCES_MAX_LIMIT = 5000
+
+def _serialize_metadata(metadata_path):
+    # El JSON guardado se envuelve tal cual, sin parsearlo ni volver a serializarlo
+    raw = b"".join(storage.iter_metadata_bytes(metadata_path))
+    return b'{"metadata":' + raw + b',"status":"found"}'
+
 @metadata_router.get("/{video_name}")
-def get_metadata(video_name: str):
+def get_metadata(video_name: str, request: Request):
     """Get metadata for specific video"""
-    metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
+    metadata_path = storage.metadata_path(video_name)
     
     if not metadata_path.exists():
         return JSONResponse(
@@ -18,9 +26,28 @@ def get_metadata(video_name: str):
         )
         
     try:
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
-        return {"metadata": metadata, "status": "found"}
+        # Respuesta serializada (y comprimida) una sola vez por versión del archivo
+        stat = metadata_path.stat()
+        entry = metadata_responses.get(
+            video_name,
+            (metadata_path.name, stat.st_mtime_ns, stat.st_size),
+            lambda: _serialize_metadata(metadata_path)
+        )
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        headers = {
+            "ETag": entry.etag(encoding),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding"
+        }
+        
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        
+        body = entry.body(encoding)
+        metadata_responses.trim()
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as e:
         return JSONResponse(
             content={"error": str(e), "status": "error"}, 
@@ -33,26 +60,24 @@ def search_object(object_label: str):
     results = []
     
     try:
-        for metadata_file in os.listdir(METADATA_DIR):
-            if metadata_file.endswith('.json'):
-                with open(os.path.join(METADATA_DIR, metadata_file), "r") as f:
-                    metadata = json.load(f)
-                
-                for detection in metadata:
-                    frame_results = []
-                    for obj in detection.get("objects", []):
-                        if obj["label"].lower() == object_label.lower():
-                            frame_results.append({
-                                "coordinates": obj["coordinates"],
-                                "confidence": obj.get("confidence", 1.0)
-                            })
-                    
-                    if frame_results:
-                        results.append({
-                            "video": metadata_file.replace('.json', ''),
-                            "frame": detection["frame"],
-                            "objects": frame_results
+        for video_name, metadata_path in storage.iter_metadata():
+            metadata = storage.load_metadata(metadata_path)
+            
+            for detection in metadata:
+                frame_results = []
+                for obj in detection.get("objects", []):
+                    if obj["label"].lower() == object_label.lower():
+                        frame_results.append({
+                            "coordinates": obj["coordinates"],
+                            "confidence": obj.get("confidence", 1.0)
                         })
+                
+                if frame_results:
+                    results.append({
+                        "video": video_name.replace('.mp4', ''),
+                        "frame": detection["frame"],
+                        "objects": frame_results
+                    })
         
         if not results:
             return JSONResponse(
@@ -72,40 +97,58 @@ def search_object(object_label: str):
     
 @metadata_router.get("/objects/{video_name}")
 def get_video_objects(video_name: str):
-    """Get unique objects detected in a specific video"""
+    """Get precomputed per-label summary of objects detected in a video"""
     try:
-        metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
+        summary = load_summary(video_name)
         
-        if not metadata_path.exists():
+        if summary is None:
             return JSONResponse(
                 content={"error": "Metadata not found", "status": "not_found"},
                 status_code=404
             )
         
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
-            
-        # Obtener objetos únicos con sus frames
-        unique_objects = {}
-        for detection in metadata:
-            frame_number = detection["frame"]
-            for obj in detection.get("objects", []):
-                label = obj["label"]
-                if label not in unique_objects:
-                    unique_objects[label] = []
-                unique_objects[label].append({
-                    "frame": frame_number,
-                    "confidence": obj["confidence"],
-                    "timestamp": frame_number / 30  # Asumiendo 30 FPS
-                })
+        return {
+            "objects": summary["objects"],
+            "fps": summary["fps"],
+            "total_frames": summary["total_frames"],
+            "bucket_seconds": summary["bucket_seconds"],
+            "status": "found"
+        }
         
-        # Convertir a lista ordenada
-        objects_list = [
-            {"label": label, "occurrences": sorted(frames, key=lambda x: x["frame"])}
-            for label, frames in unique_objects.items()
-        ]
+    except Exception as e:
+        return JSONResponse(
+            content={"error": str(e), "status": "error"},
+            status_code=500
+        )
+
+@metadata_router.get("/objects/{video_name}/{object_label}")
+def get_object_occurrences(video_name: str, object_label: str, offset: int = Query(0, ge=0),
+                           limit: int = Query(500, ge=1, le=OCCURRENCES_MAX_LIMIT)):
+    """Get paginated occurrences of one label in a video"""
+    try:
+        summary = load_summary(video_name)
+        
+        if summary is None:
+            return JSONResponse(
+                content={"error": "Metadata not found", "status": "not_found"},
+                status_code=404
+            )
+        
+        if not any(obj["label"] == object_label for obj in summary["objects"]):
+            return JSONResponse(
+                content={"error": f"No objects found with label '{object_label}'", "status": "not_found"},
+                status_code=404
+            )
         
-        return {"objects": objects_list, "status": "found"}
+        occurrences = label_occurrences(video_name, object_label, summary["fps"])
+        return {
+            "label": object_label,
+            "occurrences": occurrences[offset:offset + limit],
+            "total": len(occurrences),
+            "offset": offset,
+            "limit": limit,
+            "status": "found"
+        }
         
     except Exception as e:
         return JSONResponse(
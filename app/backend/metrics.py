@@ -0,0 +1,246 @@
+import cProfile
+import threading
+import time
+from contextlib import contextmanager
+from config import *
+import logging
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUEUE_WAIT_BUCKETS = (0.1, 1.0, 5.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self):
+        return {
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.counts)},
+            "overflow": self.counts[-1],
+            "count": self.count,
+            "sum": round(self.sum, 6)
+        }
+
+    def prometheus(self, name: str, labels: str = ""):
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+def cpu_time(clock: str = "thread"):
+    """
+    Tiempo de CPU acumulado según clock:
+    "thread": solo el hilo actual.
+    "process": todos los hilos del proceso, p.ej. la inferencia multihilo de
+    torch/ONNX Runtime (incluye también a los trabajos que corran a la vez).
+    "children": el hilo actual más los procesos hijos ya terminados y esperados,
+    como ffmpeg (no disponible en Windows, donde equivale a "thread").
+    """
+    if clock == "process":
+        return time.process_time()
+    cpu = time.thread_time()
+    if clock == "children" and resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += usage.ru_utime + usage.ru_stime
+    return cpu
+
+def _empty_stage():
+    return {"wall_seconds": 0.0, "cpu_seconds": 0.0, "frames": 0, "calls": 0}
+
+class JobMetrics:
+    """Tiempos por etapa de un trabajo de procesamiento"""
+    def __init__(self, video_name: str = None, registry=None, queue_wait: float = 0.0, profile: bool = False):
+        self.video_name = video_name
+        self.registry = registry
+        self.queue_wait = queue_wait
+        self.profile = profile
+        self.profile_paths = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = None
+        self.shards = None
+        self.stages = {}
+        self.inference = Histogram(INFERENCE_BUCKETS)
+
+    @contextmanager
+    def stage(self, name: str, frames: int = 0, clock: str = "thread"):
+        """Medir tiempo de reloj y de CPU de un bloque (ver cpu_time para clock)"""
+        wall_start = time.perf_counter()
+        cpu_start = cpu_time(clock)
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, cpu_time(clock) - cpu_start, frames)
+
+    def add(self, name: str, wall: float, cpu: float, frames: int = 0):
+        stage = self.stages.setdefault(name, _empty_stage())
+        stage["wall_seconds"] += wall
+        stage["cpu_seconds"] += cpu
+        stage["frames"] += frames
+        stage["calls"] += 1
+        if self.registry is not None:
+            self.registry.add_stage(name, wall, cpu, frames)
+
+    def observe_inference(self, seconds: float):
+        self.inference.observe(seconds)
+        if self.registry is not None:
+            self.registry.observe_inference(seconds)
+
+    def as_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            "elapsed_seconds": round(end - self.started_at, 3),
+            "queue_wait_seconds": round(self.queue_wait, 3),
+            "shards": self.shards,
+            "stages": {
+                name: {
+                    "wall_seconds": round(stage["wall_seconds"], 3),
+                    "cpu_seconds": round(stage["cpu_seconds"], 3),
+                    "frames": stage["frames"],
+                    "calls": stage["calls"]
+                }
+                for name, stage in self.stages.items()
+            },
+            "inference_latency": self.inference.as_dict(),
+            "profiles": self.profile_paths
+        }
+
+class MetricsRegistry:
+    """Métricas globales del servidor y de cada trabajo, exportables en formato Prometheus"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}
+        self._queued_at = {}
+        self._profile_requested = set()
+        self.jobs_total = {}
+        self.stage_totals = {}
+        self.inference = Histogram(INFERENCE_BUCKETS)
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+
+    def job_queued(self, video_name: str, profile: bool = False):
+        """Registrar el momento en que un video entra en cola"""
+        with self._lock:
+            self._queued_at.setdefault(video_name, time.time())
+            if profile:
+                self._profile_requested.add(video_name)
+
+    def start_job(self, video_name: str, profile: bool = False):
+        with self._lock:
+            queued_at = self._queued_at.pop(video_name, None)
+            profile = profile or PROFILE_ALL_JOBS or video_name in self._profile_requested
+            self._profile_requested.discard(video_name)
+            wait = time.time() - queued_at if queued_at else 0.0
+            self.queue_wait.observe(wait)
+            job = JobMetrics(video_name, self, wait, profile)
+            self.jobs[video_name] = job
+        return job
+
+    def finish_job(self, video_name: str, status: str):
+        with self._lock:
+            job = self.jobs.get(video_name)
+            if job is not None:
+                job.finished_at = time.time()
+                job.status = status
+            self.jobs_total[status] = self.jobs_total.get(status, 0) + 1
+
+    def get_job(self, video_name: str):
+        return self.jobs.get(video_name)
+
+    def active_jobs(self):
+        """Videos con un trabajo en curso"""
+        with self._lock:
+            return {name for name, job in self.jobs.items() if job.finished_at is None}
+
+    def add_stage(self, name: str, wall: float, cpu: float, frames: int):
+        with self._lock:
+            stage = self.stage_totals.setdefault(name, _empty_stage())
+            stage["wall_seconds"] += wall
+            stage["cpu_seconds"] += cpu
+            stage["frames"] += frames
+            stage["calls"] += 1
+
+    def observe_inference(self, seconds: float):
+        with self._lock:
+            self.inference.observe(seconds)
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus"""
+        with self._lock:
+            in_progress = sum(1 for job in self.jobs.values() if job.finished_at is None)
+            lines = [
+                "# HELP video_jobs_total Processing jobs finished, by result.",
+                "# TYPE video_jobs_total counter",
+            ]
+            lines += [f'video_jobs_total{{status="{s}"}} {n}' for s, n in self.jobs_total.items()]
+            lines += [
+                "# HELP video_jobs_in_progress Processing jobs currently running.",
+                "# TYPE video_jobs_in_progress gauge",
+                f"video_jobs_in_progress {in_progress}",
+            ]
+            for metric, key, help_text in (
+                ("video_stage_wall_seconds_total", "wall_seconds", "Wall-clock time spent per processing stage."),
+                ("video_stage_cpu_seconds_total", "cpu_seconds", "CPU time spent per processing stage."),
+                ("video_stage_frames_total", "frames", "Frames handled per processing stage."),
+            ):
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                lines += [
+                    f'{metric}{{stage="{name}"}} {stage[key]}'
+                    for name, stage in self.stage_totals.items()
+                ]
+            lines += [
+                "# HELP video_inference_seconds Detector latency per frame.",
+                "# TYPE video_inference_seconds histogram",
+            ]
+            lines += self.inference.prometheus("video_inference_seconds")
+            lines += [
+                "# HELP video_queue_wait_seconds Time between a job being queued and starting.",
+                "# TYPE video_queue_wait_seconds histogram",
+            ]
+            lines += self.queue_wait.prometheus("video_queue_wait_seconds")
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
+
+def run_profiled(job: JobMetrics, fn, *args, **kwargs):
+    """
+    Ejecutar fn en el hilo actual. Si el trabajo pidió perfilado, se ejecuta
+    bajo cProfile y el perfil se guarda en PROFILES_DIR.
+    """
+    if job is None or not job.profile:
+        return fn(*args, **kwargs)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        name = (job.video_name or "job").replace('.mp4', '')
+        path = PROFILES_DIR / f"{name}_{fn.__name__}_{int(time.time())}.prof"
+        profiler.dump_stats(str(path))
+        job.profile_paths.append(str(path))
+        logger.info(f"Perfil guardado en {path}")
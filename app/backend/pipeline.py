@@ -0,0 +1,186 @@
+import os
+import time
+import cv2
+import subprocess
+from config import *
+from detectors import load_detector
+from roi import apply_roi
+from heatmap import HeatmapAccumulator
+from metrics import JobMetrics
+import storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+def load_model(threads: int = None, video_name: str = None):
+    """Cargar el detector configurado, limitado a las regiones de interés de la cámara del video"""
+    detector = load_detector(threads)
+    return apply_roi(detector, video_name) if video_name else detector
+
+def detect_frame(model, frame):
+    """Detecciones de un frame; el filtrado por confianza lo hace cada detector"""
+    return model.detect(frame)
+
+def draw_detections(frame, objects):
+    """Dibujar las cajas y etiquetas de las detecciones sobre el frame"""
+    for obj in objects:
+        try:
+            x1, y1, x2, y2 = map(int, obj["coordinates"][0])
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"{obj['label']} {obj['confidence']:.2f}",
+                     (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        except (ValueError, IndexError) as e:
+            logger.error(f"Error dibujando detección: {str(e)}")
+            continue
+
+def start_encoder(output_path, width: int, height: int, fps: float):
+    """Iniciar ffmpeg leyendo frames BGR crudos por stdin y codificando a H.264"""
+    return subprocess.Popen([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        '-s', f'{width}x{height}',
+        '-r', f'{fps}',
+        '-i', '-',
+        '-c:v', 'libx264',
+        '-preset', 'ultrafast',
+        '-crf', '28',
+        '-movflags', '+faststart',
+        '-pix_fmt', 'yuv420p',
+        str(output_path)
+    ], stdin=subprocess.PIPE)
+
+def _discard(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def run_fused_pipeline(video_path, metadata_path=None, output_path=None, heatmap_path=None,
+                       metadata=None, progress=None, metrics: JobMetrics = None):
+    """
+    Procesar un video con una sola decodificación.
+
+    Cada frame decodificado pasa por la detección (o por la metadata recibida),
+    el acumulador del heatmap y el encoder del video anotado. Solo se generan
+    las salidas cuya ruta se indique. progress(step, percent, stages) se llama
+    periódicamente con el avance de cada etapa, y los tiempos de cada etapa se
+    registran en metrics.
+    """
+    metrics = metrics or JobMetrics()
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise Exception("Could not open video")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+    background_frame = total_frames // 2
+
+    detect = metadata is None
+    with metrics.stage("model_load"):
+        model = load_model(video_name=Path(video_path).name) if detect else None
+    frame_objects = {} if detect else {m["frame"]: m["objects"] for m in metadata}
+    if detect:
+        metadata = []
+
+    heatmap = HeatmapAccumulator(width, height) if heatmap_path else None
+    background = None
+
+    temp_output = str(output_path).replace('.mp4', '_temp.mp4') if output_path else None
+    encoder = None
+
+    stages = {
+        "detection": {"frames": 0, "total": total_frames, "enabled": detect},
+        "annotation": {"frames": 0, "total": total_frames, "enabled": output_path is not None},
+        "heatmap": {"frames": 0, "total": total_frames, "enabled": heatmap is not None},
+    }
+    report_every = max(total_frames // 50, 1)
+
+    frame_count = 0
+    decoded = False
+    try:
+        if output_path:
+            encoder = start_encoder(temp_output, width, height, fps)
+
+        while True:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            metrics.add("decode", time.perf_counter() - wall_start, time.thread_time() - cpu_start, 1)
+
+            if detect:
+                inference_start = time.perf_counter()
+                with metrics.stage("inference", frames=1, clock="process"):
+                    objects = detect_frame(model, frame)
+                metrics.observe_inference(time.perf_counter() - inference_start)
+                if objects:
+                    metadata.append({"frame": frame_count, "objects": objects})
+                stages["detection"]["frames"] += 1
+            else:
+                objects = frame_objects.get(frame_count, [])
+
+            if heatmap is not None:
+                if frame_count == background_frame:
+                    background = frame.copy()
+                with metrics.stage("heatmap", frames=1):
+                    heatmap.add(objects)
+                stages["heatmap"]["frames"] += 1
+
+            if encoder is not None:
+                with metrics.stage("drawing", frames=1):
+                    draw_detections(frame, objects)
+                try:
+                    with metrics.stage("ffmpeg", frames=1):
+                        encoder.stdin.write(frame.tobytes())
+                except BrokenPipeError:
+                    raise Exception("ffmpeg terminó antes de recibir todos los frames")
+                stages["annotation"]["frames"] += 1
+
+            frame_count += 1
+            if progress and frame_count % report_every == 0:
+                progress("fused_processing", int(90 * frame_count / total_frames), stages)
+        decoded = True
+
+    finally:
+        cap.release()
+        if encoder is not None:
+            # La CPU de ffmpeg solo se contabiliza al terminar el proceso
+            with metrics.stage("ffmpeg", clock="children"):
+                encoder.stdin.close()
+                encoder.wait()
+        # No dejar el video temporal a medias: lo contarían evict_outputs y /storage
+        if not decoded:
+            _discard(temp_output)
+
+    if metadata_path and detect:
+        try:
+            with metrics.stage("metadata_write"):
+                storage.save_metadata(metadata_path, metadata)
+        except Exception:
+            _discard(temp_output)
+            raise
+
+    if encoder is not None:
+        if progress:
+            progress("encoding_video", 90, stages)
+        if encoder.returncode != 0:
+            _discard(temp_output)
+            raise Exception(f"Error en la conversión de video: ffmpeg código {encoder.returncode}")
+        if not os.path.exists(temp_output) or os.path.getsize(temp_output) == 0:
+            _discard(temp_output)
+            raise Exception("El archivo de video generado está vacío")
+        os.replace(temp_output, str(output_path))
+
+    if heatmap is not None:
+        if progress:
+            progress("generating_heatmap", 95, stages)
+        if background is None:
+            raise Exception("Cannot read background frame")
+        with metrics.stage("heatmap"):
+            rendered = heatmap.render(background, heatmap_path)
+        if not rendered:
+            raise Exception("No detections found for heatmap generation")
+
+    return metadata
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from config import *
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Codificaciones soportadas en orden de preferencia del servidor
+ENCODINGS = ("br", "gzip", "identity") if brotli is not None else ("gzip", "identity")
+
+def _compress(body: bytes, encoding: str):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+def negotiate_encoding(accept_encoding: str):
+    """Mejor codificación disponible según la cabecera Accept-Encoding"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+
+    # Mayor q del cliente; en caso de empate, el orden de preferencia del servidor.
+    # identity sin mencionar solo se usa si no se acepta ninguna compresión
+    best, best_q = "identity", 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.001 if encoding == "identity" else 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def etag_matches(if_none_match: str, etags):
+    """Si la cabecera If-None-Match (lista de etiquetas, débiles o no) contiene alguna de etags"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or any(etag in tags for etag in etags)
+
+class CachedResponse:
+    """Cuerpo serializado de una respuesta y sus versiones comprimidas, calculadas la primera vez que se piden"""
+    def __init__(self, version, body: bytes):
+        self.version = version
+        self.digest = hashlib.sha1(body).hexdigest()
+        self.bodies = {"identity": body}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return sum(len(body) for body in self.bodies.values())
+
+    def etag(self, encoding: str):
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest}{suffix}"'
+
+    def matches(self, if_none_match: str):
+        """Si If-None-Match contiene la etiqueta de cualquiera de las versiones"""
+        return etag_matches(if_none_match, [self.etag(encoding) for encoding in ENCODINGS])
+
+    def body(self, encoding: str):
+        with self._lock:
+            if encoding not in self.bodies:
+                self.bodies[encoding] = _compress(self.bodies["identity"], encoding)
+            return self.bodies[encoding]
+
+class ResponseCache:
+    """
+    Caché LRU en memoria de respuestas ya serializadas. Cada entrada guarda la
+    versión de su origen (p.ej. fecha de modificación y tamaño del archivo) y
+    se recalcula cuando cambia.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version, build):
+        """Entrada de key para version; build() genera el cuerpo en bytes si no está en caché"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = CachedResponse(version, build())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+        return entry
+
+    def trim(self):
+        """Eliminar las entradas menos usadas hasta que la caché quepa en max_bytes"""
+        with self._lock:
+            used = sum(entry.size for entry in self._entries.values())
+            while used > self.max_bytes and len(self._entries) > 1:
+                _, entry = self._entries.popitem(last=False)
+                used -= entry.size
+
+metadata_responses = ResponseCache(METADATA_RESPONSE_CACHE_BYTES)
@@ -0,0 +1,313 @@
+import sqlite3
+import hashlib
+import shutil
+import json
+import threading
+import time
+import os
+from config import *
+from database import insert_or_update_video_data
+import storage
+from roi import camera_id, effective_mask_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = CACHE_DIR / "blobs"
+BLOBS_DIR.mkdir(exist_ok=True)
+
+# Artefactos que se guardan por cada combinación video + modelo + parámetros
+ARTIFACTS = ("metadata", "video", "heatmap")
+
+# Serializa store() y evict(): un blob recién copiado no tiene fila hasta que store() la inserta
+_lock = threading.Lock()
+
+def _connect():
+    """Abrir conexión a la base de datos asegurando las tablas de la caché"""
+    conn = sqlite3.connect(str(DATABASE_PATH), timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS result_cache (
+            cache_key TEXT PRIMARY KEY,
+            metadata_blob TEXT NOT NULL,
+            video_blob TEXT NOT NULL,
+            heatmap_blob TEXT NOT NULL,
+            params TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS video_outputs (
+            video_name TEXT PRIMARY KEY,
+            cache_key TEXT NOT NULL
+        )
+    ''')
+    return conn
+
+def artifact_paths(video_name: str):
+    """Rutas de salida de cada artefacto de un video"""
+    return {
+        "metadata": storage.metadata_path(video_name),
+        "video": OUTPUT_VIDEOS_DIR / f"processed_{video_name}",
+        "heatmap": OUTPUT_VIDEOS_DIR / f"heatmap_{video_name.replace('.mp4', '.png')}",
+    }
+
+def _hash_file(path: Path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def file_sha256(path: Path):
+    """Hash SHA-256 de un archivo, memorizado por tamaño y fecha de modificación"""
+    stat = path.stat()
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?",
+            (str(path),)
+        ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        digest = _hash_file(path)
+        conn.execute(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (str(path), stat.st_size, stat.st_mtime_ns, digest)
+        )
+        conn.commit()
+        return digest
+    finally:
+        conn.close()
+
+def detection_params(video_name: str):
+    """Parámetros que afectan al resultado de la detección de un video"""
+    model_hash = file_sha256(MODEL_PATH) if MODEL_PATH.exists() else MODEL_PATH.name
+    params = {
+        "model": model_hash,
+        "confidence": CONFIDENCE_THRESHOLD,
+        "backend": DETECTOR_BACKEND,
+        "imgsz": INFERENCE_IMGSZ,
+    }
+    if DETECTOR_BACKEND == "onnx":
+        params["int8"] = ONNX_QUANTIZE
+    if ROI_ENABLED:
+        params["roi"] = [ROI_MARGIN, ROI_MAX_COVERAGE, ROI_FULL_FRAME_INTERVAL]
+        # Máscara de la cámara del video (configurada o aprendida)
+        mask = effective_mask_path(camera_id(video_name))
+        params["roi_mask"] = file_sha256(mask) if mask is not None else None
+    return params
+
+def cache_key(video_name: str):
+    """Clave de caché: hash del video original + hash del modelo + parámetros"""
+    source_hash = file_sha256(VIDEOS_ORIGINAL_DIR / video_name)
+    payload = json.dumps(
+        {"source": source_hash, "params": detection_params(video_name)},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _blob_path(digest: str):
+    return BLOBS_DIR / digest[:2] / digest
+
+def lookup(key: str):
+    """Obtener la entrada de caché para una clave, o None si no existe"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT metadata_blob, video_blob, heatmap_blob FROM result_cache WHERE cache_key = ?",
+            (key,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+
+    entry = dict(zip(ARTIFACTS, row))
+    if not all(_blob_path(digest).exists() for digest in entry.values()):
+        # Blob perdido: la entrada ya no es utilizable
+        forget(key)
+        return None
+    return entry
+
+def forget(key: str):
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (key,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_output_key(video_name: str):
+    """Clave de caché con la que se generaron los archivos de salida actuales"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT cache_key FROM video_outputs WHERE video_name = ?",
+            (video_name,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def set_output_key(video_name: str, key: str):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO video_outputs (video_name, cache_key) VALUES (?, ?)",
+            (video_name, key)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def store(video_name: str, key: str):
+    """Guardar los artefactos generados de un video como blobs direccionados por contenido"""
+    paths = artifact_paths(video_name)
+    params = json.dumps(detection_params(video_name), sort_keys=True)
+    digests = {}
+    total_size = 0
+
+    with _lock:
+        for artifact, path in paths.items():
+            digest = _hash_file(path)
+            blob = _blob_path(digest)
+            if not blob.exists():
+                blob.parent.mkdir(exist_ok=True)
+                tmp_blob = blob.with_suffix(".tmp")
+                shutil.copyfile(path, tmp_blob)
+                os.replace(tmp_blob, blob)
+            digests[artifact] = digest
+            total_size += blob.stat().st_size
+
+        conn = _connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO result_cache
+                (cache_key, metadata_blob, video_blob, heatmap_blob, params, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                key, digests["metadata"], digests["video"], digests["heatmap"],
+                params, total_size, time.time()
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+    set_output_key(video_name, key)
+    evict()
+
+def restore(video_name: str, key: str):
+    """
+    Copiar los artefactos cacheados a las rutas de salida del video.
+    Retorna True si la clave estaba en caché.
+    """
+    paths = artifact_paths(video_name)
+    with _lock:
+        entry = lookup(key)
+        if entry is None:
+            return False
+
+        for artifact, path in paths.items():
+            # Se copia (no hardlink) para que reescribir la salida no altere el blob
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            shutil.copyfile(_blob_path(entry[artifact]), tmp_path)
+            os.replace(tmp_path, path)
+
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE result_cache SET last_access = ? WHERE cache_key = ?",
+            (time.time(), key)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    insert_or_update_video_data(
+        video_name,
+        processed_video_path=f"/output_videos/processed_{video_name}",
+        heatmap_path=f"/output_videos/heatmap_{video_name.replace('.mp4', '.png')}"
+    )
+    set_output_key(video_name, key)
+    logger.info(f"Resultados de {video_name} restaurados desde caché ({key[:12]})")
+    return True
+
+def evict(max_bytes: int = CACHE_MAX_BYTES):
+    """Eliminar las entradas menos usadas hasta que la caché quepa en max_bytes"""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT cache_key, metadata_blob, video_blob, heatmap_blob FROM result_cache ORDER BY last_access DESC"
+            ).fetchall()
+
+            # Los blobs se comparten entre entradas, así que se cuentan una sola vez
+            kept_blobs = set()
+            evicted_blobs = set()
+            used_bytes = 0
+            evicted = []
+            for key, *blobs in rows:
+                new_blobs = [b for b in blobs if b not in kept_blobs]
+                entry_bytes = sum(
+                    _blob_path(b).stat().st_size for b in new_blobs if _blob_path(b).exists()
+                )
+                if used_bytes + entry_bytes > max_bytes and used_bytes > 0:
+                    evicted.append(key)
+                    evicted_blobs.update(blobs)
+                    continue
+                kept_blobs.update(blobs)
+                used_bytes += entry_bytes
+
+            for key in evicted:
+                conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Borrar solo los blobs de las entradas eliminadas que no usa ninguna otra
+        for digest in evicted_blobs - kept_blobs:
+            _blob_path(digest).unlink(missing_ok=True)
+
+    if evicted:
+        logger.info(f"Caché: {len(evicted)} entradas eliminadas, {used_bytes} bytes en uso")
+    return evicted
+
+def resolve(video_name: str, key: str):
+    """
+    Dejar las salidas de un video listas para la clave actual si es posible.
+    Retorna True si ya están completas (existentes o restauradas desde caché).
+    Las salidas generadas con otra clave se eliminan para que se regeneren.
+    """
+    paths = artifact_paths(video_name)
+    outputs_ready = all(p.exists() and p.stat().st_size > 0 for p in paths.values())
+    output_key = get_output_key(video_name)
+
+    if outputs_ready and output_key is None:
+        # Salidas generadas antes de la caché: se adoptan con la clave actual para
+        # que un cambio posterior de modelo o parámetros sí las invalide
+        set_output_key(video_name, key)
+        return True
+
+    current = output_key is None or output_key == key
+    if outputs_ready and current:
+        return True
+
+    if restore(video_name, key):
+        return True
+
+    if not current:
+        logger.info(f"Salidas de {video_name} obsoletas, se regenerarán")
+        for path in paths.values():
+            path.unlink(missing_ok=True)
+    return False
@@ -0,0 +1,206 @@
+import math
+import cv2
+import numpy as np
+from config import *
+from detectors import Detector, nms
+import storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Regiones calculadas por cámara y tamaño de frame, compartidas dentro del proceso,
+# junto con la versión de la máscara de la que salieron
+_regions_cache = {}
+
+def camera_id(video_name: str):
+    """
+    Identificador de cámara a partir del nombre VIRAT: VIRAT_S_XXYYZZ_... donde
+    XXYY identifica la escena (cámara fija). Para otros nombres se usa el nombre completo.
+    """
+    parts = Path(video_name).stem.split('_')
+    if len(parts) > 2 and parts[0] == "VIRAT" and len(parts[2]) >= 4:
+        return parts[2][:4]
+    return Path(video_name).stem
+
+def mask_path(camera: str, learned: bool = False):
+    return ROI_DIR / (f"{camera}_learned.png" if learned else f"{camera}.png")
+
+def learn_mask(camera: str, width: int, height: int):
+    """
+    Aprender la máscara de actividad de una cámara a partir de las detecciones
+    guardadas en la metadata de todos sus videos: se cuenta cuántas cajas cubren
+    cada píxel y se conservan los que superan ROI_DENSITY_THRESHOLD del máximo,
+    para que una detección aislada no active su zona. Retorna None si no hay
+    suficientes detecciones.
+    """
+    # Conteo por diferencias: +1/-1 en las esquinas de cada caja y suma acumulada en ambos ejes
+    hits = np.zeros((height + 1, width + 1), dtype=np.int32)
+    detections = 0
+
+    for video_name, path in storage.iter_metadata():
+        if camera_id(video_name) != camera:
+            continue
+        metadata = storage.load_metadata(path)
+        for detection in metadata:
+            for obj in detection.get("objects", []):
+                x1, y1, x2, y2 = map(int, obj["coordinates"][0])
+                x1, x2 = max(x1, 0), min(x2, width)
+                y1, y2 = max(y1, 0), min(y2, height)
+                if x1 >= x2 or y1 >= y2:
+                    continue
+                hits[y1, x1] += 1
+                hits[y1, x2] -= 1
+                hits[y2, x1] -= 1
+                hits[y2, x2] += 1
+                detections += 1
+
+    if detections < ROI_MIN_DETECTIONS:
+        return None
+
+    density = hits.cumsum(axis=0).cumsum(axis=1)[:height, :width]
+    threshold = max(ROI_DENSITY_THRESHOLD * density.max(), 1)
+    mask = np.where(density >= threshold, 255, 0).astype(np.uint8)
+
+    cv2.imwrite(str(mask_path(camera, learned=True)), mask)
+    logger.info(
+        f"Máscara ROI aprendida para la cámara {camera} con {detections} detecciones "
+        f"({np.count_nonzero(mask) / mask.size:.0%} del frame)"
+    )
+    return mask
+
+def effective_mask_path(camera: str):
+    """Archivo de máscara que se usa para la cámara: el configurado o, si no hay, el aprendido"""
+    for learned in (False, True):
+        path = mask_path(camera, learned)
+        if path.exists():
+            return path
+    return None
+
+def mask_version(camera: str):
+    """
+    Versión de la máscara efectiva de una cámara. Sin máscara depende de la
+    metadata disponible, para reintentar el aprendizaje cuando se añade más.
+    """
+    path = effective_mask_path(camera)
+    if path is not None:
+        return (path.name, path.stat().st_mtime_ns)
+    return (None, METADATA_DIR.stat().st_mtime_ns)
+
+def load_mask(camera: str, width: int, height: int):
+    """Máscara configurada (roi_masks/<cámara>.png) o aprendida; None si no hay"""
+    for learned in (False, True):
+        path = mask_path(camera, learned)
+        if path.exists():
+            mask = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if mask is not None:
+                if mask.shape != (height, width):
+                    mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+                return mask
+    return learn_mask(camera, width, height)
+
+def mask_regions(mask, margin: int = ROI_MARGIN):
+    """
+    Rectángulos (x1, y1, x2, y2) que cubren las zonas activas de la máscara,
+    ampliadas en margin píxeles. Retorna None si cubren casi todo el frame y
+    recortar no compensa.
+    """
+    height, width = mask.shape
+    active = (mask > 0).astype(np.uint8)
+    if margin > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * margin + 1, 2 * margin + 1))
+        active = cv2.dilate(active, kernel)
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(active)
+    regions = [
+        [int(x), int(y), int(x + w), int(y + h)]
+        for x, y, w, h, _ in stats[1:count]
+    ]
+
+    # Unir rectángulos que se solapan para no detectar dos veces la misma zona
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+    if not regions or covered > ROI_MAX_COVERAGE * width * height:
+        return None
+    return [tuple(r) for r in regions]
+
+def camera_regions(video_name: str, width: int, height: int):
+    key = (camera_id(video_name), width, height)
+    cached = _regions_cache.get(key)
+    if cached is None or cached[0] != mask_version(key[0]):
+        mask = load_mask(key[0], width, height)
+        # La versión se toma después de cargar: load_mask puede haber aprendido y guardado la máscara
+        regions = mask_regions(mask) if mask is not None else None
+        _regions_cache[key] = (mask_version(key[0]), regions)
+        logger.info(f"Regiones ROI de la cámara {key[0]}: {regions}")
+    return _regions_cache[key][1]
+
+def adaptive_imgsz(crop_width: int, crop_height: int, frame_width: int, frame_height: int):
+    """
+    Tamaño de entrada para un recorte que conserva la escala de los objetos de la
+    inferencia a cuadro completo, redondeado al múltiplo de 32 superior.
+    """
+    scale = INFERENCE_IMGSZ / max(frame_width, frame_height)
+    size = max(crop_width, crop_height) * scale
+    return int(min(INFERENCE_IMGSZ, max(32, math.ceil(size / 32) * 32)))
+
+class RoiDetector(Detector):
+    """
+    Ejecuta el detector solo sobre las regiones activas de una cámara fija, con
+    un tamaño de entrada proporcional a cada región, y devuelve las cajas en
+    coordenadas del frame completo. Cada ROI_FULL_FRAME_INTERVAL frames se
+    analiza el frame completo para no perder objetos en zonas nuevas.
+    """
+    def __init__(self, base: Detector, video_name: str):
+        self.base = base
+        self.names = base.names
+        self.video_name = video_name
+        self.frames = 0
+
+    def detect(self, frame, imgsz: int = None):
+        height, width = frame.shape[:2]
+        regions = camera_regions(self.video_name, width, height)
+        full_frame = ROI_FULL_FRAME_INTERVAL and self.frames % ROI_FULL_FRAME_INTERVAL == 0
+        self.frames += 1
+
+        if regions is None or full_frame:
+            return self.base.detect(frame, imgsz)
+
+        detections = []
+        for x1, y1, x2, y2 in regions:
+            crop = frame[y1:y2, x1:x2]
+            crop_imgsz = adaptive_imgsz(x2 - x1, y2 - y1, width, height)
+            for obj in self.base.detect(crop, crop_imgsz):
+                bx1, by1, bx2, by2 = obj["coordinates"][0]
+                obj["coordinates"] = [[bx1 + x1, by1 + y1, bx2 + x1, by2 + y1]]
+                detections.append(obj)
+
+        if len(regions) > 1 and detections:
+            # Eliminar duplicados de objetos que caen en el borde de dos regiones
+            labels = {label: i for i, label in enumerate({d["label"] for d in detections})}
+            keep = nms(
+                np.array([d["coordinates"][0] for d in detections], dtype=np.float32),
+                np.array([d["confidence"] for d in detections], dtype=np.float32),
+                np.array([labels[d["label"]] for d in detections])
+            )
+            detections = [detections[i] for i in keep]
+
+        return detections
+
+def apply_roi(detector: Detector, video_name: str):
+    """Envolver el detector con RoiDetector si ROI_ENABLED"""
+    if not ROI_ENABLED:
+        return detector
+    return RoiDetector(detector, video_name)
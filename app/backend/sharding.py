@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from config import *
+from metrics import JobMetrics
+import storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Modelo cargado una vez por proceso worker
+_worker_model = None
+
+def keyframe_indices(video_path):
+    """
+    Índices (en orden de presentación, como CAP_PROP_POS_FRAMES) de los
+    keyframes del video según ffprobe. Se usan como límites de los shards para
+    que cada worker empiece a decodificar en un keyframe. Los paquetes salen en
+    orden de decodificación, que con B-frames no coincide con el de los frames,
+    así que se usan las marcas de tiempo de los frames clave convertidas con
+    los FPS del stream. Retorna None si ffprobe no está disponible.
+    """
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            # Decodificar solo los keyframes
+            '-skip_frame', 'nokey',
+            '-show_entries', 'frame=best_effort_timestamp_time:stream=r_frame_rate,start_time',
+            '-of', 'json',
+            str(video_path)
+        ], capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout)
+        stream = probe["streams"][0]
+        num, _, den = stream["r_frame_rate"].partition('/')
+        fps = float(num) / float(den or 1)
+        start_time = float(stream.get("start_time") or 0)
+        times = [
+            float(frame["best_effort_timestamp_time"])
+            for frame in probe.get("frames", [])
+            if frame.get("best_effort_timestamp_time") not in (None, "N/A")
+        ]
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError, ZeroDivisionError) as e:
+        logger.warning(f"No se pudieron leer los keyframes: {str(e)}")
+        return None
+
+    return sorted({round((t - start_time) * fps) for t in times})
+
+def plan_shards(total_frames: int, workers: int, keyframes=None, min_frames: int = SHARD_MIN_FRAMES):
+    """Dividir [0, total_frames) en rangos contiguos alineados en keyframes"""
+    num_shards = max(1, min(workers, total_frames // max(min_frames, 1)))
+    boundaries = [0]
+
+    for i in range(1, num_shards):
+        target = total_frames * i // num_shards
+        if keyframes:
+            # Keyframe más cercano al punto de corte ideal
+            target = min(keyframes, key=lambda k: abs(k - target))
+        if boundaries[-1] < target < total_frames:
+            boundaries.append(target)
+
+    boundaries.append(total_frames)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _init_worker(threads: int):
+    global _worker_model
+    cv2.setNumThreads(threads)
+
+    from pipeline import load_model
+    _worker_model = load_model(threads)
+
+def _detect_range(video_path: str, start: int, end: int = None):
+    """Detectar objetos en los frames [start, end) de un video (hasta el final si end es None)"""
+    from pipeline import detect_frame
+    from roi import apply_roi
+
+    model = apply_roi(_worker_model, Path(video_path).name)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("Could not open video")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    metadata = []
+    timings = {"decode": [0.0, 0.0, 0], "inference": [0.0, 0.0, 0]}
+    latencies = []
+    frame_count = start
+
+    try:
+        while end is None or frame_count < end:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            timings["decode"][0] += time.perf_counter() - wall_start
+            timings["decode"][1] += time.thread_time() - cpu_start
+            timings["decode"][2] += 1
+
+            # Cada worker procesa un solo shard: la CPU del proceso es la de su inferencia multihilo
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            detections = detect_frame(model, frame)
+            latencies.append(time.perf_counter() - wall_start)
+            timings["inference"][0] += latencies[-1]
+            timings["inference"][1] += time.process_time() - cpu_start
+            timings["inference"][2] += 1
+
+            if detections:
+                metadata.append({
+                    "frame": frame_count,
+                    "objects": detections
+                })
+            frame_count += 1
+    finally:
+        cap.release()
+
+    return metadata, timings, latencies
+
+def generate_metadata_sharded(video_path: str, output_metadata_path: str, workers: int = None,
+                              metrics: JobMetrics = None, min_frames: int = SHARD_MIN_FRAMES):
+    """
+    Versión de generate_metadata que reparte el video en rangos de frames
+    alineados en keyframes y los procesa en un pool de procesos, cada uno con
+    su propio modelo y límite de hilos. El resultado es idéntico en formato y
+    orden al de generate_metadata. El número de shards usado queda en metrics.shards.
+    """
+    metrics = metrics or JobMetrics()
+    workers = workers or SHARD_WORKERS
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise Exception("Could not open video")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    with metrics.stage("shard_planning"):
+        keyframes = keyframe_indices(video_path) if workers > 1 else None
+        shards = plan_shards(total_frames, workers, keyframes, min_frames)
+    metrics.shards = len(shards)
+
+    threads = max(1, (os.cpu_count() or 1) // len(shards))
+    logger.info(f"Detección en {len(shards)} shards con {threads} hilos por worker: {shards}")
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=ctx,
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        with metrics.stage("sharded_detection", frames=total_frames):
+            # El último shard lee hasta el final: CAP_PROP_FRAME_COUNT es solo una estimación
+            futures = [
+                pool.submit(_detect_range, str(video_path), start, end if i < len(shards) - 1 else None)
+                for i, (start, end) in enumerate(shards)
+            ]
+            results = [future.result() for future in futures]
+
+    metadata = []
+    for shard_metadata, timings, latencies in results:
+        metadata.extend(shard_metadata)
+        for name, (wall, cpu, frames) in timings.items():
+            metrics.add(name, wall, cpu, frames)
+        for latency in latencies:
+            metrics.observe_inference(latency)
+    metadata.sort(key=lambda m: m["frame"])
+
+    storage.save_metadata(output_metadata_path, metadata)
+
+    return metadata
@@ -0,0 +1,276 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from fastapi import APIRouter
+from config import *
+from database import insert_or_update_video_data
+from metrics import metrics_registry
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+storage_router = APIRouter()
+
+# Extensión de los archivos de metadata según la compresión
+METADATA_SUFFIXES = {"zstd": ".json.zst", "gzip": ".json.gz", "none": ".json"}
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_LEVEL = 6
+CHUNK_SIZE = 64 * 1024
+
+USAGE_KINDS = ("original", "metadata", "processed_video", "heatmap", "summary")
+
+def metadata_codec():
+    """Compresión con la que se escribe la metadata nueva (gzip si zstandard no está instalado)"""
+    if METADATA_COMPRESSION == "zstd" and zstandard is None:
+        return "gzip"
+    return METADATA_COMPRESSION
+
+def _split_metadata_name(name: str):
+    """(nombre base, extensión) de un archivo de metadata, o None si no lo es"""
+    for suffix in METADATA_SUFFIXES.values():
+        if name.endswith(suffix) and not name.startswith("."):
+            return name[:-len(suffix)], suffix
+    return None
+
+def metadata_candidates(video_name: str):
+    stem = video_name.replace('.mp4', '')
+    return [METADATA_DIR / f"{stem}{suffix}" for suffix in METADATA_SUFFIXES.values()]
+
+def metadata_path(video_name: str):
+    """Archivo de metadata existente de un video, o la ruta donde debe escribirse"""
+    for path in metadata_candidates(video_name):
+        if path.exists():
+            return path
+    return METADATA_DIR / f"{video_name.replace('.mp4', '')}{METADATA_SUFFIXES[metadata_codec()]}"
+
+def metadata_exists(video_name: str):
+    path = metadata_path(video_name)
+    return path.exists() and path.stat().st_size > 0
+
+def iter_metadata():
+    """(nombre del video, ruta) de cada archivo de metadata"""
+    with os.scandir(METADATA_DIR) as entries:
+        for entry in entries:
+            parts = _split_metadata_name(entry.name)
+            if parts and entry.is_file():
+                yield f"{parts[0]}.mp4", Path(entry.path)
+
+@contextmanager
+def open_metadata(path: Path):
+    """
+    Abrir un archivo de metadata como flujo binario de JSON descomprimido.
+    El formato se detecta por el contenido, no por la extensión, para leer
+    también archivos restaurados desde la caché con otra compresión.
+    """
+    f = open(path, "rb")
+    try:
+        magic = f.read(4)
+        f.seek(0)
+        if magic.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise RuntimeError(f"{path.name} está comprimido con zstd y zstandard no está instalado")
+            yield zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+        elif magic.startswith(GZIP_MAGIC):
+            yield gzip.GzipFile(fileobj=f)
+        else:
+            yield f
+    finally:
+        f.close()
+
+def load_metadata(path: Path):
+    with open_metadata(path) as stream:
+        return json.load(stream)
+
+def iter_metadata_bytes(path: Path, chunk_size: int = CHUNK_SIZE):
+    """JSON descomprimido en bloques, sin cargar el archivo completo"""
+    with open_metadata(path) as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            yield chunk
+
+def save_metadata(path: Path, metadata):
+    """
+    Guardar la metadata con la compresión que indica la extensión de path y
+    eliminar las copias del mismo video con otra extensión.
+    """
+    path = Path(path)
+    data = json.dumps(metadata).encode()
+    if path.name.endswith(METADATA_SUFFIXES["zstd"]):
+        data = zstandard.ZstdCompressor(level=METADATA_COMPRESSION_LEVEL).compress(data)
+    elif path.name.endswith(METADATA_SUFFIXES["gzip"]):
+        # mtime=0 para que el mismo contenido produzca el mismo archivo (y el mismo blob en caché)
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    parts = _split_metadata_name(path.name)
+    if parts:
+        for suffix in METADATA_SUFFIXES.values():
+            if suffix != parts[1]:
+                path.with_name(parts[0] + suffix).unlink(missing_ok=True)
+    return path
+
+def migrate_metadata():
+    """
+    Recomprimir la metadata guardada con otro formato (p.ej. JSON plano) con el
+    actual. No se ejecuta al arrancar (la metadata en otro formato se sigue
+    leyendo): se lanza con `python storage.py migrate`.
+    """
+    target = METADATA_SUFFIXES[metadata_codec()]
+    before = after = 0
+    for video_name, path in list(iter_metadata()):
+        if path.name.endswith(target):
+            continue
+        stat = path.stat()
+        new_path = save_metadata(METADATA_DIR / f"{video_name.replace('.mp4', '')}{target}", load_metadata(path))
+        # Conservar la fecha de modificación para no invalidar resúmenes ni comparaciones de fechas
+        os.utime(new_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        before += stat.st_size
+        after += new_path.stat().st_size
+    if before:
+        logger.info(f"Metadata recomprimida con {metadata_codec()}: {before} -> {after} bytes")
+    return before, after
+
+def output_video_name(file_name: str):
+    """Video original al que pertenece un archivo de OUTPUT_VIDEOS_DIR, o None"""
+    if file_name.startswith("processed_") and file_name.endswith(".mp4"):
+        return file_name[len("processed_"):]
+    if file_name.startswith("heatmap_") and file_name.endswith(".png"):
+        return file_name[len("heatmap_"):-len(".png")] + ".mp4"
+    return None
+
+def mark_accessed(path: Path):
+    """Registrar un acceso en la fecha de acceso del archivo (independiente de noatime)"""
+    try:
+        os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+    except FileNotFoundError:
+        pass
+
+def evict_outputs(max_bytes: int = OUTPUTS_MAX_BYTES, max_age_days: float = OUTPUTS_MAX_AGE_DAYS, keep=()):
+    """
+    Borrar videos procesados y heatmaps que se pueden regenerar (existen el
+    video original y su metadata): primero los que no se usan desde hace más de
+    max_age_days días y luego, del menos usado al más usado, hasta que las
+    salidas quepan en max_bytes. Los videos de keep y los que se están
+    procesando no se tocan. Retorna los archivos borrados.
+    """
+    keep = set(keep) | metrics_registry.active_jobs()
+    now = time.time()
+    total = 0
+    candidates = []
+
+    with os.scandir(OUTPUT_VIDEOS_DIR) as entries:
+        for entry in entries:
+            video_name = output_video_name(entry.name)
+            if video_name is None or not entry.is_file():
+                continue
+            stat = entry.stat()
+            total += stat.st_size
+            if (video_name in keep or not (VIDEOS_ORIGINAL_DIR / video_name).exists()
+                    or not metadata_exists(video_name)):
+                continue
+            candidates.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.name, video_name))
+
+    evicted = []
+    for accessed, size, file_name, video_name in sorted(candidates):
+        expired = max_age_days and now - accessed > max_age_days * 86400
+        if not expired and not (max_bytes and total > max_bytes):
+            break
+        (OUTPUT_VIDEOS_DIR / file_name).unlink(missing_ok=True)
+        total -= size
+        evicted.append(file_name)
+        if file_name.startswith("processed_"):
+            insert_or_update_video_data(video_name, processed_video_path="")
+        else:
+            insert_or_update_video_data(video_name, heatmap_path="")
+
+    if evicted:
+        logger.info(f"Almacenamiento: {len(evicted)} salidas regenerables eliminadas, {total} bytes en uso")
+    return evicted
+
+def _dir_size(directory: Path):
+    return sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+
+def disk_usage():
+    """Espacio en disco por video y por tipo de archivo"""
+    videos = {}
+
+    def add(video_name, kind, size):
+        usage = videos.setdefault(video_name, dict.fromkeys(USAGE_KINDS, 0))
+        usage[kind] += size
+
+    for path in VIDEOS_ORIGINAL_DIR.glob("*.mp4"):
+        add(path.name, "original", path.stat().st_size)
+    for video_name, path in iter_metadata():
+        add(video_name, "metadata", path.stat().st_size)
+    with os.scandir(OUTPUT_VIDEOS_DIR) as entries:
+        for entry in entries:
+            video_name = output_video_name(entry.name)
+            if video_name is not None and entry.is_file():
+                kind = "processed_video" if entry.name.startswith("processed_") else "heatmap"
+                add(video_name, kind, entry.stat().st_size)
+    for path in SUMMARIES_DIR.glob("*.json"):
+        add(path.name.replace('.json', '.mp4'), "summary", path.stat().st_size)
+
+    totals = dict.fromkeys(USAGE_KINDS, 0)
+    for usage in videos.values():
+        usage["total"] = sum(usage[kind] for kind in USAGE_KINDS)
+        for kind in USAGE_KINDS:
+            totals[kind] += usage[kind]
+    totals["cache"] = _dir_size(CACHE_DIR)
+    totals["database"] = DATABASE_PATH.stat().st_size if DATABASE_PATH.exists() else 0
+    totals["total"] = sum(totals.values())
+
+    return {
+        "videos": dict(sorted(videos.items())),
+        "totals": totals,
+        "metadata_compression": metadata_codec(),
+        "limits": {
+            "outputs_max_bytes": OUTPUTS_MAX_BYTES,
+            "outputs_max_age_days": OUTPUTS_MAX_AGE_DAYS,
+            "cache_max_bytes": CACHE_MAX_BYTES
+        }
+    }
+
+def init_storage():
+    evict_outputs()
+
+@storage_router.get("")
+def get_disk_usage():
+    return disk_usage()
+
+@storage_router.post("/evict")
+def run_eviction():
+    evicted = evict_outputs()
+    return {"evicted": evicted, "totals": disk_usage()["totals"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento del almacenamiento")
+    parser.add_argument("command", choices=("migrate", "evict", "usage"),
+                        help="migrate: recomprimir la metadata con METADATA_COMPRESSION; "
+                             "evict: aplicar los límites a las salidas; usage: espacio en disco")
+    args = parser.parse_args()
+
+    from database import init_database
+    init_database()
+
+    if args.command == "migrate":
+        before, after = migrate_metadata()
+        print(f"Metadata recomprimida con {metadata_codec()}: {before} -> {after} bytes")
+    elif args.command == "evict":
+        print(json.dumps(run_eviction(), indent=2))
+    else:
+        print(json.dumps(disk_usage(), indent=2))
+
+if __name__ == "__main__":
+    main()
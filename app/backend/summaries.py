@@ -0,0 +1,127 @@
+import json
+import cv2
+from config import *
+import storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BINS = 10
+
+def summary_path(video_name: str):
+    return SUMMARIES_DIR / f"{video_name.replace('.mp4', '.json')}"
+
+def video_timing(video_name: str):
+    """FPS y número de frames reales del video original (30 FPS si no se puede leer)"""
+    cap = cv2.VideoCapture(str(VIDEOS_ORIGINAL_DIR / video_name))
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+    return (fps or 30.0), total_frames
+
+def build_summary(metadata, fps: float, total_frames: int):
+    """
+    Resumen por etiqueta: número de detecciones, frames en los que aparece,
+    primera/última aparición, histograma de confianza y ocupación por intervalo
+    de SUMMARY_BUCKET_SECONDS segundos.
+    """
+    if metadata:
+        total_frames = max(total_frames, max(d["frame"] for d in metadata) + 1)
+    frames_per_bucket = max(int(round(fps * SUMMARY_BUCKET_SECONDS)), 1)
+    num_buckets = max((total_frames + frames_per_bucket - 1) // frames_per_bucket, 1)
+
+    labels = {}
+    for detection in metadata:
+        frame_number = detection["frame"]
+        seen_in_frame = set()
+        for obj in detection.get("objects", []):
+            label = obj["label"]
+            if label not in labels:
+                labels[label] = {
+                    "label": label,
+                    "count": 0,
+                    "frames": 0,
+                    "first_frame": frame_number,
+                    "last_frame": frame_number,
+                    "confidence_histogram": [0] * HISTOGRAM_BINS,
+                    "occupancy": [0] * num_buckets
+                }
+            summary = labels[label]
+            summary["count"] += 1
+            summary["first_frame"] = min(summary["first_frame"], frame_number)
+            summary["last_frame"] = max(summary["last_frame"], frame_number)
+            confidence = float(obj.get("confidence", 1.0))
+            summary["confidence_histogram"][min(int(confidence * HISTOGRAM_BINS), HISTOGRAM_BINS - 1)] += 1
+
+            if label not in seen_in_frame:
+                seen_in_frame.add(label)
+                summary["frames"] += 1
+                summary["occupancy"][frame_number // frames_per_bucket] += 1
+
+    objects = []
+    for summary in labels.values():
+        summary["first_seen"] = round(summary["first_frame"] / fps, 3)
+        summary["last_seen"] = round(summary["last_frame"] / fps, 3)
+        # Fracción de frames de cada intervalo en los que aparece la etiqueta
+        summary["occupancy"] = [
+            round(frames / min(frames_per_bucket, total_frames - i * frames_per_bucket), 3)
+            for i, frames in enumerate(summary["occupancy"])
+        ]
+        objects.append(summary)
+
+    objects.sort(key=lambda s: s["count"], reverse=True)
+    return {
+        "fps": fps,
+        "total_frames": total_frames,
+        "bucket_seconds": SUMMARY_BUCKET_SECONDS,
+        "objects": objects
+    }
+
+def write_summary(video_name: str, metadata=None):
+    """Calcular y guardar el resumen de un video a partir de su metadata"""
+    if metadata is None:
+        metadata = storage.load_metadata(storage.metadata_path(video_name))
+
+    fps, total_frames = video_timing(video_name)
+    summary = build_summary(metadata, fps, total_frames)
+
+    path = summary_path(video_name)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(summary, f)
+    tmp_path.replace(path)
+    return summary
+
+def load_summary(video_name: str):
+    """
+    Obtener el resumen guardado de un video. Se recalcula si no existe o si la
+    metadata es más reciente (p.ej. tras restaurarla desde la caché).
+    Retorna None si no hay metadata.
+    """
+    metadata_path = storage.metadata_path(video_name)
+    if not metadata_path.exists():
+        return None
+
+    path = summary_path(video_name)
+    if path.exists() and path.stat().st_mtime_ns >= metadata_path.stat().st_mtime_ns:
+        with open(path, "r") as f:
+            return json.load(f)
+
+    logger.info(f"Generando resumen de objetos para {video_name}")
+    return write_summary(video_name)
+
+def label_occurrences(video_name: str, label: str, fps: float):
+    """Lista completa de apariciones de una etiqueta, ordenada por frame"""
+    metadata = storage.load_metadata(storage.metadata_path(video_name))
+
+    occurrences = []
+    for detection in sorted(metadata, key=lambda d: d["frame"]):
+        frame_number = detection["frame"]
+        for obj in detection.get("objects", []):
+            if obj["label"] == label:
+                occurrences.append({
+                    "frame": frame_number,
+                    "confidence": obj["confidence"],
+                    "timestamp": frame_number / fps
+                })
+    return occurrences
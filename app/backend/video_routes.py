@@ -1,16 +1,23 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Query
 from fastapi.responses import JSONResponse, Response
 import os
-import json
 import cv2
 from config import *
 from database import insert_or_update_video_data, get_video_data
-from ultralytics import YOLO
 import numpy as np
 import subprocess
 from heatmap import generate_heatmap_background
+from pipeline import load_model, detect_frame, draw_detections, run_fused_pipeline
+from sharding import generate_metadata_sharded
+import result_cache
+import storage
+from summaries import write_summary
+from catalog import video_catalog, VIDEO_STATES
+from response_cache import etag_matches
+from metrics import metrics_registry, run_profiled, JobMetrics
 import random
 import asyncio
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,7 +28,7 @@ class ProcessingStatus:
         self.status = {}
         self._lock = asyncio.Lock()
 
-    async def set_progress(self, video_name: str, progress: int, step: str):
+    async def set_progress(self, video_name: str, progress: int, step: str, stages: dict = None):
         async with self._lock:
             self.status[video_name] = {
                 "status": "processing" if progress < 100 else "completed",
@@ -29,6 +36,8 @@ class ProcessingStatus:
                 "step": step,
                 "files": await self.check_generated_files(video_name)
             }
+            if stages is not None:
+                self.status[video_name]["stages"] = stages
 
     async def get_progress(self, video_name: str):
         async with self._lock:
@@ -39,15 +48,23 @@ class ProcessingStatus:
                     "step": "not_started",
                     "files": await self.check_generated_files(video_name)
                 }
-            return self.status[video_name]
+            status = dict(self.status[video_name])
+            job = metrics_registry.get_job(video_name)
+            if job is not None:
+                status["metrics"] = job.as_dict()
+            return status
+
+    def is_running(self, video_name: str):
+        """Si el video tiene un trabajo en curso (los fallidos quedan como "processing" con progreso -1)"""
+        status = self.status.get(video_name)
+        return status is not None and status["status"] == "processing" and status["progress"] >= 0
 
     async def check_generated_files(self, video_name: str):
-        metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
         processed_path = OUTPUT_VIDEOS_DIR / f"processed_{video_name}"
         heatmap_path = OUTPUT_VIDEOS_DIR / f"heatmap_{video_name.replace('.mp4', '.png')}"
         
         return {
-            "metadata_ready": metadata_path.exists() and metadata_path.stat().st_size > 0,
+            "metadata_ready": storage.metadata_exists(video_name),
             "video_ready": processed_path.exists() and processed_path.stat().st_size > 0,
             "heatmap_ready": heatmap_path.exists() and heatmap_path.stat().st_size > 0
         }
@@ -58,20 +75,38 @@ class ProcessingStatus:
 
 processing_status = ProcessingStatus()
 
+# Regeneraciones lanzadas al pedir una salida borrada por la política de almacenamiento
+_regeneration_tasks = set()
+
 @video_router.get("/available-videos")
-async def get_available_videos():
+async def get_available_videos(request: Request, offset: int = Query(0, ge=0), limit: int = Query(None, ge=1),
+                               state: str = None):
     try:
         if not LIST_FILE.exists():
             return {"videos": [], "message": "No se encontró el archivo de lista"}
-        
-        with open(LIST_FILE, "r") as file:
-            videos = [
-                line.strip() + ".mp4"
-                for line in file.readlines()
-                if line.strip() and 
-                (VIDEOS_ORIGINAL_DIR / f"{line.strip()}.mp4").exists()
-            ]
-        return {"videos": videos}
+
+        if state is not None and state not in VIDEO_STATES:
+            raise HTTPException(status_code=400, detail=f"Estado inválido, use uno de {', '.join(VIDEO_STATES)}")
+
+        processing = [name for name in processing_status.status if processing_status.is_running(name)]
+        videos, states, total, etag = video_catalog.query(processing, state, offset, limit)
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), [etag]):
+            return Response(status_code=304, headers=headers)
+
+        return JSONResponse(
+            content={
+                "videos": videos,
+                "states": states,
+                "total": total,
+                "offset": offset,
+                "limit": limit
+            },
+            headers=headers
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en available-videos: {str(e)}")
         return JSONResponse(
@@ -84,23 +119,19 @@ async def get_available_videos():
         )
 
 @video_router.get("/process/{video_name}")
-async def process_video(video_name: str, background_tasks: BackgroundTasks):
+async def process_video(video_name: str, background_tasks: BackgroundTasks, profile: bool = False):
     try:
         video_path = VIDEOS_ORIGINAL_DIR / video_name
         if not video_path.exists():
             raise HTTPException(status_code=404, detail=f"Video no encontrado")
 
         # Verificar si ya está en proceso
-        current_status = await processing_status.get_progress(video_name)
-        if current_status["status"] == "processing":
-            return current_status
+        if processing_status.is_running(video_name):
+            return await processing_status.get_progress(video_name)
 
-        # Verificar si ya está todo procesado
-        files_status = current_status.get("files", {})
-        if (files_status.get("metadata_ready", False) and 
-            files_status.get("video_ready", False) and 
-            files_status.get("heatmap_ready", False)):
-            
+        # Verificar si ya está todo procesado o si el resultado está en caché
+        key = await asyncio.to_thread(result_cache.cache_key, video_name)
+        if await asyncio.to_thread(result_cache.resolve, video_name, key):
             return {
                 "status": "completed",
                 "progress": 100,
@@ -110,6 +141,7 @@ async def process_video(video_name: str, background_tasks: BackgroundTasks):
             }
 
         # Iniciar procesamiento
+        metrics_registry.job_queued(video_name, profile)
         background_tasks.add_task(
             process_video_background,
             video_name
@@ -136,13 +168,16 @@ async def get_processing_status(video_name: str):
             files_status.get("video_ready") and 
             files_status.get("heatmap_ready")):
             
-            return {
+            completed = {
                 "status": "completed",
                 "progress": 100,
                 "step": "completed",
                 "processed_video_path": f"/output_videos/processed_{video_name}",
                 "heatmap_path": f"/output_videos/heatmap_{video_name.replace('.mp4', '.png')}"
             }
+            if "metrics" in current_status:
+                completed["metrics"] = current_status["metrics"]
+            return completed
 
         return current_status
         
@@ -150,30 +185,52 @@ async def get_processing_status(video_name: str):
         logger.error(f"Error getting status: {str(e)}")
         return {"status": "error", "message": str(e)}
 
-async def process_video_background(video_name: str):
+async def process_video_background(video_name: str, profile: bool = False):
+    job = metrics_registry.start_job(video_name, profile)
     try:
         video_path = VIDEOS_ORIGINAL_DIR / video_name
-        metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
         output_path = OUTPUT_VIDEOS_DIR / f"processed_{video_name}"
 
+        # Restaurar desde caché o descartar salidas obsoletas
+        with job.stage("cache_lookup"):
+            key = await asyncio.to_thread(result_cache.cache_key, video_name)
+            cached = await asyncio.to_thread(result_cache.resolve, video_name, key)
+        if cached:
+            metrics_registry.finish_job(video_name, "cached")
+            await processing_status.set_progress(video_name, 100, "completed")
+            return
+
         # Verificar archivos existentes
         files_status = await processing_status.check_generated_files(video_name)
+        metadata_path = storage.metadata_path(video_name)
+
+        # Detección repartida en varios procesos; el resto de salidas se generan después
+        if SHARDED_DETECTION and not files_status["metadata_ready"]:
+            await processing_status.set_progress(video_name, 0, "generating_metadata_sharded")
+            await asyncio.to_thread(
+                generate_metadata_sharded, str(video_path), str(metadata_path), metrics=job
+            )
+            files_status = await processing_status.check_generated_files(video_name)
+
+        # Pipeline fusionado: una sola decodificación para todas las salidas pendientes
+        if FUSED_PIPELINE and not all(files_status.values()):
+            await process_video_fused(video_name, files_status, job)
+            files_status = await processing_status.check_generated_files(video_name)
 
         # Generar metadata si no existe
         if not files_status["metadata_ready"]:
             await processing_status.set_progress(video_name, 0, "generating_metadata")
-            metadata = generate_metadata(str(video_path), str(metadata_path))
-            metadata_json = json.dumps(metadata)
-            insert_or_update_video_data(video_name, metadata=metadata_json)
+            await asyncio.to_thread(
+                run_profiled, job, generate_metadata, str(video_path), str(metadata_path), metrics=job
+            )
             await processing_status.set_progress(video_name, 33, "metadata_complete")
 
         # Procesar video si no existe
         if not files_status["video_ready"]:
             await processing_status.set_progress(video_name, 33, "processing_video")
-            with open(metadata_path) as f:
-                metadata = json.load(f)
+            metadata = await asyncio.to_thread(storage.load_metadata, metadata_path)
             
-            await process_video_with_metadata(video_path, output_path, metadata)
+            await asyncio.to_thread(process_video_with_metadata, video_path, output_path, metadata, metrics=job)
             processed_path = f"/output_videos/processed_{video_name}"
             insert_or_update_video_data(video_name, processed_video_path=processed_path)
             await processing_status.set_progress(video_name, 66, "video_complete")
@@ -181,20 +238,102 @@ async def process_video_background(video_name: str):
         # Generar heatmap si no existe
         if not files_status["heatmap_ready"]:
             await processing_status.set_progress(video_name, 66, "generating_heatmap")
-            await generate_heatmap_background(video_name)
+            with job.stage("heatmap"):
+                await asyncio.to_thread(generate_heatmap_background, video_name)
 
         # Verificar estado final
         final_status = await processing_status.check_generated_files(video_name)
         if all(final_status.values()):
+            with job.stage("cache_store"):
+                # Recalcular la clave: la detección puede haber aprendido la máscara ROI de la cámara
+                key = await asyncio.to_thread(result_cache.cache_key, video_name)
+                await asyncio.to_thread(result_cache.store, video_name, key)
+            with job.stage("summary"):
+                await asyncio.to_thread(write_summary, video_name)
+            metrics_registry.finish_job(video_name, "completed")
             await processing_status.set_progress(video_name, 100, "completed")
+            # Aplicar los límites de almacenamiento a las salidas de otros videos
+            await asyncio.to_thread(storage.evict_outputs, keep=(video_name,))
         else:
             raise Exception("No se generaron todos los archivos correctamente")
 
     except Exception as e:
         logger.error(f"Error in background processing: {str(e)}")
+        metrics_registry.finish_job(video_name, "failed")
         await processing_status.set_progress(video_name, -1, f"error: {str(e)}")
         raise
 
+async def regenerate_outputs(video_name: str):
+    """
+    Recuperar las salidas de un video borradas por los límites de almacenamiento.
+    Retorna True si quedaron disponibles (restauradas desde la caché) y False si
+    se lanzó su regeneración en segundo plano a partir de la metadata guardada.
+    Retorna None si el video no tiene metadata (nunca se procesó o quedó
+    obsoleta): en ese caso no se procesa, ya que requeriría inferencia.
+    """
+    if not storage.metadata_exists(video_name):
+        return None
+
+    key = await asyncio.to_thread(result_cache.cache_key, video_name)
+    if await asyncio.to_thread(result_cache.resolve, video_name, key):
+        return True
+    if not storage.metadata_exists(video_name):
+        return None
+
+    if not processing_status.is_running(video_name) and video_name not in metrics_registry.active_jobs():
+        logger.info(f"Regenerando salidas de {video_name}")
+        metrics_registry.job_queued(video_name)
+        task = asyncio.create_task(process_video_background(video_name))
+        _regeneration_tasks.add(task)
+        task.add_done_callback(_regeneration_done)
+    return False
+
+def _regeneration_done(task: asyncio.Task):
+    _regeneration_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Error regenerando salidas: {str(task.exception())}")
+
+async def process_video_fused(video_name: str, files_status: dict, job: JobMetrics = None):
+    """Generar en un solo recorrido del video las salidas que falten"""
+    video_path = VIDEOS_ORIGINAL_DIR / video_name
+    metadata_path = storage.metadata_path(video_name)
+    output_path = OUTPUT_VIDEOS_DIR / f"processed_{video_name}"
+    heatmap_path = OUTPUT_VIDEOS_DIR / f"heatmap_{video_name.replace('.mp4', '.png')}"
+
+    metadata = None
+    if files_status["metadata_ready"]:
+        metadata = storage.load_metadata(metadata_path)
+
+    loop = asyncio.get_running_loop()
+
+    def report(step, progress, stages):
+        asyncio.run_coroutine_threadsafe(
+            processing_status.set_progress(
+                video_name, progress, step, {name: dict(stage) for name, stage in stages.items()}
+            ),
+            loop
+        )
+
+    await processing_status.set_progress(video_name, 0, "fused_processing")
+    await asyncio.to_thread(
+        run_profiled,
+        job,
+        run_fused_pipeline,
+        video_path,
+        metadata_path=None if files_status["metadata_ready"] else metadata_path,
+        output_path=None if files_status["video_ready"] else output_path,
+        heatmap_path=None if files_status["heatmap_ready"] else heatmap_path,
+        metadata=metadata,
+        progress=report,
+        metrics=job
+    )
+
+    if not files_status["video_ready"]:
+        insert_or_update_video_data(video_name, processed_video_path=f"/output_videos/processed_{video_name}")
+    if not files_status["heatmap_ready"]:
+        heatmap_rel_path = f"/output_videos/heatmap_{video_name.replace('.mp4', '.png')}"
+        insert_or_update_video_data(video_name, heatmap_path=heatmap_rel_path)
+
 @video_router.get("/{video_name}")
 async def serve_video(video_name: str):
     try:
@@ -219,17 +358,18 @@ async def serve_video(video_name: str):
 
 def check_video_status(video_name: str):
     processed_path = OUTPUT_VIDEOS_DIR / f"processed_{video_name}"
-    metadata_path = METADATA_DIR / f"{video_name.replace('.mp4', '.json')}"
     original_path = VIDEOS_ORIGINAL_DIR / video_name
     
     return {
         "has_processed": processed_path.exists(),
-        "has_metadata": metadata_path.exists(),
+        "has_metadata": storage.metadata_exists(video_name),
         "has_original": original_path.exists()
     }
 
-def generate_metadata(video_path: str, output_metadata_path: str):
-    model = YOLO(str(MODEL_PATH))
+def generate_metadata(video_path: str, output_metadata_path: str, metrics: JobMetrics = None):
+    metrics = metrics or JobMetrics()
+    with metrics.stage("model_load"):
+        model = load_model(video_name=Path(video_path).name)
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         raise Exception("Could not open video")
@@ -238,22 +378,16 @@ def generate_metadata(video_path: str, output_metadata_path: str):
     frame_count = 0
 
     while True:
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
         ret, frame = cap.read()
         if not ret:
             break
+        metrics.add("decode", time.perf_counter() - wall_start, time.thread_time() - cpu_start, 1)
 
-        results = model(frame)
-        detections = []
-
-        for r in results[0]:
-            for box, cls, conf in zip(r.boxes.xyxy, r.boxes.cls, r.boxes.conf):
-                if conf > 0.3:
-                    coords = box.cpu().numpy()
-                    detections.append({
-                        "label": model.names[int(cls)],
-                        "confidence": float(conf),
-                        "coordinates": [[int(c) for c in coords]]
-                    })
+        inference_start = time.perf_counter()
+        with metrics.stage("inference", frames=1, clock="process"):
+            detections = detect_frame(model, frame)
+        metrics.observe_inference(time.perf_counter() - inference_start)
 
         if detections:
             metadata.append({
@@ -265,12 +399,12 @@ def generate_metadata(video_path: str, output_metadata_path: str):
 
     cap.release()
     
-    with open(output_metadata_path, 'w') as f:
-        json.dump(metadata, f)
+    storage.save_metadata(output_metadata_path, metadata)
 
     return metadata
 
-async def process_video_with_metadata(input_path, output_path, metadata):
+def process_video_with_metadata(input_path, output_path, metadata, metrics: JobMetrics = None):
+    metrics = metrics or JobMetrics()
     cap = cv2.VideoCapture(str(input_path))
     if not cap.isOpened():
         raise Exception("Could not open video for processing")
@@ -287,27 +421,22 @@ async def process_video_with_metadata(input_path, output_path, metadata):
     if not writer.isOpened():
         raise Exception("No se pudo inicializar el writer de video")
 
+    frame_objects = {m["frame"]: m["objects"] for m in metadata}
+
     frame_count = 0
     try:
         while True:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
             ret, frame = cap.read()
             if not ret:
                 break
+            metrics.add("decode", time.perf_counter() - wall_start, time.thread_time() - cpu_start, 1)
 
-            frame_metadata = next((m for m in metadata if m["frame"] == frame_count), None)
-            
-            if frame_metadata:
-                for obj in frame_metadata["objects"]:
-                    try:
-                        x1, y1, x2, y2 = map(int, obj["coordinates"][0])
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(frame, f"{obj['label']} {obj['confidence']:.2f}",
-                                 (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                    except (ValueError, IndexError) as e:
-                        logger.error(f"Error dibujando detección: {str(e)}")
-                        continue
-
-            writer.write(frame)
+            with metrics.stage("drawing", frames=1):
+                draw_detections(frame, frame_objects.get(frame_count, []))
+
+            with metrics.stage("encoding", frames=1):
+                writer.write(frame)
             frame_count += 1
 
     finally:
@@ -315,15 +444,16 @@ async def process_video_with_metadata(input_path, output_path, metadata):
         writer.release()
 
     try:
-        subprocess.run([
-            'ffmpeg', '-i', temp_output,
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-crf', '28',
-            '-movflags', '+faststart',
-            '-pix_fmt', 'yuv420p',
-            str(output_path)
-        ], check=True)
+        with metrics.stage("ffmpeg", frames=frame_count, clock="children"):
+            subprocess.run([
+                'ffmpeg', '-i', temp_output,
+                '-c:v', 'libx264',
+                '-preset', 'ultrafast',
+                '-crf', '28',
+                '-movflags', '+faststart',
+                '-pix_fmt', 'yuv420p',
+                str(output_path)
+            ], check=True)
         
         if os.path.exists(temp_output):
             os.remove(temp_output)
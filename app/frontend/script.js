@@ -2,6 +2,10 @@ const API_URL = 'http://127.0.0.1:8000';
 
 let processingMonitorInterval = null;
 
+// Búsqueda de objetos paginada: se cargan OCCURRENCES_PAGE_SIZE apariciones por petición
+const OCCURRENCES_PAGE_SIZE = 500;
+let objectSearch = null;
+
 document.addEventListener('DOMContentLoaded', () => {
     const videoSelect = document.getElementById('video-select');
     loadVideoList();
@@ -274,7 +278,7 @@ async function loadVideoObjects() {
             data.objects.forEach(obj => {
                 const option = document.createElement('option');
                 option.value = obj.label;
-                option.textContent = `${obj.label} (${obj.occurrences.length} veces)`;
+                option.textContent = `${obj.label} (${obj.count} veces)`;
                 objectSelect.appendChild(option);
             });
         }
@@ -296,31 +300,22 @@ async function searchObjects() {
     }
     
     try {
-        const response = await fetch(`${API_URL}/metadata/objects/${videoName}`);
-        const data = await response.json();
+        const data = await fetchOccurrences(videoName, objectLabel, 0);
         
-        if (data.status === 'found') {
-            const objectData = data.objects.find(obj => obj.label === objectLabel);
+        if (data.status === 'found' || data.status === 'not_found') {
+            const objectData = data.status === 'found' ? data : null;
             if (objectData) {
-                const resultsHTML = objectData.occurrences.map(occurrence => `
-                    <div class="result-card">
-                        <div class="result-info">
-                            <span>Frame: ${occurrence.frame}</span>
-                            <span>Tiempo: ${occurrence.timestamp.toFixed(2)}s</span>
-                        </div>
-                        <button class="jump-button" onclick="jumpToTimestamp(${occurrence.timestamp})">
-                            Ir al momento
-                        </button>
-                    </div>
-                `).join('');
-                
+                objectSearch = { videoName, objectLabel, loaded: 0, total: objectData.total };
                 searchResults.innerHTML = `
-                    <h3>Resultados para "${objectLabel}"</h3>
-                    <div class="results-container">
-                        ${resultsHTML}
-                    </div>
+                    <h3 id="search-results-title"></h3>
+                    <div class="results-container" id="results-container"></div>
+                    <button class="load-more-button" id="load-more-button" onclick="loadMoreOccurrences()">
+                        Cargar más
+                    </button>
                 `;
+                appendOccurrences(objectData);
             } else {
+                objectSearch = null;
                 searchResults.innerHTML = `<p>No se encontró el objeto "${objectLabel}" en este video</p>`;
             }
         }
@@ -330,6 +325,60 @@ async function searchObjects() {
     }
 }
 
+async function fetchOccurrences(videoName, objectLabel, offset) {
+    const response = await fetch(
+        `${API_URL}/metadata/objects/${videoName}/${encodeURIComponent(objectLabel)}` +
+        `?offset=${offset}&limit=${OCCURRENCES_PAGE_SIZE}`
+    );
+    return response.json();
+}
+
+function appendOccurrences(data) {
+    const resultsHTML = data.occurrences.map(occurrence => `
+        <div class="result-card">
+            <div class="result-info">
+                <span>Frame: ${occurrence.frame}</span>
+                <span>Tiempo: ${occurrence.timestamp.toFixed(2)}s</span>
+            </div>
+            <button class="jump-button" onclick="jumpToTimestamp(${occurrence.timestamp})">
+                Ir al momento
+            </button>
+        </div>
+    `).join('');
+
+    document.getElementById('results-container').insertAdjacentHTML('beforeend', resultsHTML);
+    objectSearch.loaded += data.occurrences.length;
+    objectSearch.total = data.total;
+
+    document.getElementById('search-results-title').textContent =
+        `Resultados para "${objectSearch.objectLabel}" (${objectSearch.loaded} de ${objectSearch.total})`;
+    document.getElementById('load-more-button').style.display =
+        objectSearch.loaded < objectSearch.total ? 'block' : 'none';
+}
+
+async function loadMoreOccurrences() {
+    const search = objectSearch;
+    if (!search) return;
+    const button = document.getElementById('load-more-button');
+    button.disabled = true;
+
+    try {
+        const data = await fetchOccurrences(search.videoName, search.objectLabel, search.loaded);
+        // Ignorar la página si mientras tanto se hizo otra búsqueda
+        if (search !== objectSearch) return;
+        if (data.status === 'found') {
+            appendOccurrences(data);
+        } else {
+            showError('Error al cargar más resultados');
+        }
+    } catch (error) {
+        console.error('Error cargando más resultados:', error);
+        showError('Error al cargar más resultados');
+    } finally {
+        button.disabled = false;
+    }
+}
+
 function jumpToTimestamp(timestamp) {
     const videoPlayer = document.getElementById('video-player');
     if (videoPlayer) {